@@ -0,0 +1,184 @@
+import argparse
+import json
+import os
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+from SetStats import CARD_ATTRS, CONTEXT_COLUMNS, TRAIT_OPTIONS
+
+TIME_BINS = np.concatenate([[0], np.geomspace(0.01, 3600, 128), [np.inf]])
+CHUNK_SIZE = 100000
+
+
+class TimeAggregate:
+    def __init__(self):
+        self.groups = {}
+
+    def add(self, key, times):
+        times = np.asarray(times, dtype=np.float64)
+        if key not in self.groups:
+            self.groups[key] = [0, 0.0, 0.0, np.inf, -np.inf, np.zeros(len(TIME_BINS) - 1, dtype=np.int64)]
+        g = self.groups[key]
+        g[0] += len(times)
+        g[1] += times.sum()
+        g[2] += (times ** 2).sum()
+        g[3] = min(g[3], times.min())
+        g[4] = max(g[4], times.max())
+        g[5] += np.histogram(times, TIME_BINS)[0]
+
+    def merge(self, other):
+        for key, (n, s, sq, lo, hi, hist) in other.groups.items():
+            if key not in self.groups:
+                self.groups[key] = [n, s, sq, lo, hi, hist.copy()]
+            else:
+                g = self.groups[key]
+                g[0] += n
+                g[1] += s
+                g[2] += sq
+                g[3] = min(g[3], lo)
+                g[4] = max(g[4], hi)
+                g[5] += hist
+        return self
+
+    def quantile(self, key, q):
+        # Linear within the bin, whose edges are narrowed to the group's range
+        lo, hi, hist = self.groups[key][3:]
+        cum = np.cumsum(hist)
+        target = q * cum[-1]
+        idx = min(int(np.searchsorted(cum, target)), len(hist) - 1)
+        left, right = max(TIME_BINS[idx], lo), min(TIME_BINS[idx + 1], hi)
+        before = cum[idx - 1] if idx else 0
+        frac = (target - before) / hist[idx] if hist[idx] else 0.0
+        return float(min(max(left + frac * (right - left), lo), hi))
+
+    def summary(self):
+        rows = []
+        for key in sorted(self.groups, key=str):
+            n, s, sq, lo, hi, _ = self.groups[key]
+            mean = s / n
+            rows.append({"group": key, "n": n, "mean": mean, "std": max(sq / n - mean ** 2, 0) ** 0.5,
+                         "min": lo, "p50": self.quantile(key, 0.5), "p90": self.quantile(key, 0.9), "max": hi})
+        return pd.DataFrame(rows)
+
+    def dump(self):
+        return [[key, n, s, sq, lo, hi, hist.tolist()] for key, (n, s, sq, lo, hi, hist) in self.groups.items()]
+
+    @staticmethod
+    def load(groups):
+        agg = TimeAggregate()
+        for key, n, s, sq, lo, hi, hist in groups:
+            agg.groups[key if not isinstance(key, list) else tuple(key)] = [n, s, sq, lo, hi, np.array(hist)]
+        return agg
+
+
+def _groupings():
+    groups = {
+        "all": lambda chunk: pd.Series(0, index=chunk.index),
+        "IsRand": lambda chunk: chunk["IsRand"],
+        "IsHint": lambda chunk: chunk["IsHint"],
+        "same_traits": lambda chunk: (chunk[[f"Set.{attr}" for attr in CARD_ATTRS]] != -1).sum(axis=1),
+        "table_size": lambda chunk: chunk[TRAIT_OPTIONS[-1]].sum(axis=1),
+    }
+    for attr, options in zip(CARD_ATTRS, TRAIT_OPTIONS):
+        col = f"Set.{attr}"
+        first = 1 if attr == "Count" else 0
+
+        def same(chunk, col=col):
+            return (chunk[col] != -1).astype(int)
+
+        def value(chunk, col=col):
+            return chunk[col]
+
+        def share(chunk, col=col, options=options, first=first):
+            # How many cards on the table had the trait value the set agreed on
+            counts = chunk[options].to_numpy()
+            val = chunk[col].to_numpy()
+            rows = np.arange(len(chunk))
+            return pd.Series(np.where(val != -1, counts[rows, np.clip(val - first, 0, 2)], -1), index=chunk.index)
+
+        groups[f"{attr}.same"] = same
+        groups[f"{attr}.value"] = value
+        groups[f"{attr}.share"] = share
+    return groups
+
+
+GROUPINGS = _groupings()
+
+
+class TraitAnalysis:
+    def __init__(self):
+        self.rows = 0
+        self.aggregates = {name: TimeAggregate() for name in GROUPINGS}
+
+    def update(self, chunk: pd.DataFrame):
+        self.rows += len(chunk)
+        for name, grouping in GROUPINGS.items():
+            for key, times in chunk["Time"].groupby(grouping(chunk).to_numpy()):
+                self.aggregates[name].add(int(key), times.to_numpy())
+
+    def merge(self, other):
+        self.rows += other.rows
+        for name, agg in other.aggregates.items():
+            self.aggregates[name].merge(agg)
+        return self
+
+    def dump(self):
+        return {"rows": self.rows, "aggregates": {name: agg.dump() for name, agg in self.aggregates.items()}}
+
+    @staticmethod
+    def load(data):
+        analysis = TraitAnalysis()
+        analysis.rows = data["rows"]
+        for name, groups in data["aggregates"].items():
+            analysis.aggregates[name] = TimeAggregate.load(groups)
+        return analysis
+
+    def report(self):
+        lines = [f"Sets analyzed: {self.rows}"]
+        for name, agg in self.aggregates.items():
+            if agg.groups:
+                lines.append(f"\nTime to find by {name}:\n{agg.summary().to_string(index=False)}")
+        return "\n".join(lines)
+
+
+def analyze_file(path, chunksize=CHUNK_SIZE):
+    analysis = TraitAnalysis()
+    # Files written by older versions store the counts as floats, so they are cast after parsing
+    counts = {col: np.int16 for col in CONTEXT_COLUMNS if col != "Time"}
+    for chunk in pd.read_csv(path, usecols=CONTEXT_COLUMNS, dtype=np.float64, chunksize=chunksize):
+        analysis.update(chunk.dropna().astype(counts))
+    return analysis
+
+
+def analyze(paths, workers=None, chunksize=CHUNK_SIZE):
+    result = TraitAnalysis()
+    if len(paths) == 1 or workers == 1:
+        for path in paths:
+            result.merge(analyze_file(path, chunksize))
+        return result
+    with Pool(min(workers or os.cpu_count(), len(paths))) as pool:
+        for partial in pool.starmap(analyze_file, [(path, chunksize) for path in paths]):
+            result.merge(partial)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream stats files and aggregate time to find sets by card traits")
+    parser.add_argument("paths", nargs="*", help="stats CSV files")
+    parser.add_argument("--merge", nargs="*", default=[], help="partial aggregates saved with --save")
+    parser.add_argument("--save", help="write the aggregates as JSON for later merging")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+    result = analyze(args.paths, args.workers, args.chunksize) if args.paths else TraitAnalysis()
+    for path in args.merge:
+        result.merge(TraitAnalysis.load(json.load(open(path))))
+    if args.save:
+        json.dump(result.dump(), open(args.save, "w"))
+    print(result.report())
+
+
+if __name__ == "__main__":
+    main()
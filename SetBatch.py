@@ -0,0 +1,73 @@
+from functools import lru_cache
+
+import numpy as np
+
+from SetEngine import CARD_COUNT, THIRD, digits
+
+DIGITS = np.array([digits(code) for code in range(CARD_COUNT)], dtype=np.int8)
+EMPTY_SLOT = -1
+MAX_TABLE = 21
+# THIRD extended with an extra row and column for empty slots
+THIRD_EXT = np.full((CARD_COUNT + 1, CARD_COUNT + 1), CARD_COUNT, dtype=np.intp)
+THIRD_EXT[:CARD_COUNT, :CARD_COUNT] = THIRD
+
+
+def check_sets(triples):
+    triples = np.asarray(triples, dtype=np.intp)
+    valid = (triples >= 0).all(axis=-1)
+    d = DIGITS[np.where(triples >= 0, triples, 0)].sum(axis=-2, dtype=np.int8)
+    return valid & (d % 3 == 0).all(axis=-1) & (triples[..., 0] != triples[..., 1])
+
+
+@lru_cache(maxsize=None)
+def _index_pairs(n):
+    # Same (i, j) order as SetGameField.find_set scans them in
+    pairs = np.array([(i, j) for i in range(n) for j in range(i)], dtype=np.intp).reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def table_sets(tables):
+    # For every slot pair (i, j), i > j, the slot k < j completing it to a set, or -1
+    tables = np.atleast_2d(np.asarray(tables, dtype=np.intp))
+    width = CARD_COUNT + 1
+    base = np.arange(len(tables))[:, None] * width
+    cards = np.where(tables >= 0, tables, CARD_COUNT)
+    pos = np.full(len(tables) * width, -1, dtype=np.int8)
+    pos[base + cards] = np.arange(tables.shape[1], dtype=np.int8)
+    pos[base[:, 0] + CARD_COUNT] = -1
+    i, j = _index_pairs(tables.shape[1])
+    k = pos[base + THIRD_EXT.ravel()[cards[:, i] * width + cards[:, j]]]
+    return np.where(k < j, k, -1), i, j
+
+
+def count_sets(tables, chunk=4096):
+    tables = np.asarray(tables, dtype=np.intp)
+    if tables.ndim == 1:
+        return int(count_sets(tables[None], chunk)[0])
+    counts = np.zeros(len(tables), dtype=np.intp)
+    for s in range(0, len(tables), chunk):
+        counts[s:s + chunk] = (table_sets(tables[s:s + chunk])[0] >= 0).sum(axis=1)
+    return counts
+
+
+def first_sets(tables, chunk=4096):
+    tables = np.atleast_2d(np.asarray(tables, dtype=np.intp))
+    out = np.full((len(tables), 3), -1, dtype=np.intp)
+    for s in range(0, len(tables), chunk):
+        k, i, j = table_sets(tables[s:s + chunk])
+        has = (k >= 0).any(axis=1)
+        first = (k >= 0).argmax(axis=1)[has]
+        out[s:s + chunk][has] = np.column_stack([i[first], j[first], k[has, first]])
+    return out
+
+
+def find_sets(tables, chunk=4096):
+    tables = np.asarray(tables, dtype=np.intp)
+    if tables.ndim == 1:
+        return find_sets(tables[None], chunk)[:, 1:]
+    found = [np.zeros((0, 4), dtype=np.intp)]
+    for s in range(0, len(tables), chunk):
+        k, i, j = table_sets(tables[s:s + chunk])
+        t, p = np.nonzero(k >= 0)
+        found.append(np.column_stack([t + s, i[p], j[p], k[t, p]]))
+    return np.concatenate(found)
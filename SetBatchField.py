@@ -0,0 +1,219 @@
+import argparse
+import time
+
+import numpy as np
+
+from SetBatch import EMPTY_SLOT, MAX_TABLE, find_sets, first_sets
+from SetEngine import CARD_COUNT
+from SetGameField import GameField
+
+_LAST = np.iinfo(np.intp).max
+
+
+def _segment_keys(lengths, width, offset=0, start=None):
+    j = np.arange(width)
+    if start is None:
+        return np.where(j < lengths[:, None], offset + j, _LAST)
+    return np.where((j >= start[:, None]) & (j < (start + lengths)[:, None]), offset + j - start[:, None], _LAST)
+
+
+def _concat_segments(parts):
+    # Stable concatenation of variable-length row segments given as (values, sort keys) pairs
+    values = np.concatenate([v for v, _ in parts], axis=1)
+    keys = np.concatenate([k for _, k in parts], axis=1)
+    order = np.argsort(keys, axis=1, kind="stable")[:, :CARD_COUNT]
+    return np.take_along_axis(values, order, axis=1)
+
+
+class BatchField:
+    def __init__(self, games, seed=None):
+        self.games = games
+        self.rng = np.random.default_rng(seed)
+        self.table = np.full((games, MAX_TABLE), EMPTY_SLOT, dtype=np.intp)
+        self.table_len = np.zeros(games, dtype=np.intp)
+        self.deck = np.tile(np.arange(CARD_COUNT, dtype=np.intp), (games, 1))
+        self.head = np.zeros(games, dtype=np.intp)
+        self.deck_end = np.full(games, CARD_COUNT, dtype=np.intp)
+        self.found = np.full((games, CARD_COUNT), EMPTY_SLOT, dtype=np.intp)
+        self.found_len = np.zeros(games, dtype=np.intp)
+        # Permutations applied by the last shuffle or flip_found, as (game, permutation) pairs
+        self.last_perms = []
+        self.shuffle()
+
+    def _rows(self, mask):
+        return np.arange(self.games) if mask is None else np.flatnonzero(mask)
+
+    def deck_size(self):
+        return self.deck_end - self.head
+
+    def _deal(self, rows):
+        three = np.arange(3)
+        self.table[rows[:, None], self.table_len[rows, None] + three] = self.deck[rows[:, None], self.head[rows, None] + three]
+        self.table_len[rows] += 3
+        self.head[rows] += 3
+
+    def _deal_until_set(self, rows, need_deck=True):
+        while len(rows):
+            rows = rows[first_sets(self.table[rows])[:, 0] < 0]
+            if need_deck:
+                rows = rows[self.head[rows] < self.deck_end[rows]]
+            if len(rows):
+                self._deal(rows)
+
+    def shuffle(self, mask=None):
+        rows = self._rows(mask)
+        deck_len = self.deck_size()[rows]
+        found_len = self.found_len[rows]
+        cards = _concat_segments([
+            (self.deck[rows], _segment_keys(deck_len, CARD_COUNT, 0, self.head[rows])),
+            (self.found[rows], _segment_keys(found_len, CARD_COUNT, CARD_COUNT)),
+            (self.table[rows], _segment_keys(self.table_len[rows], MAX_TABLE, 2 * CARD_COUNT)),
+        ])
+        perms = self.rng.permuted(np.tile(np.arange(CARD_COUNT), (len(rows), 1)), axis=1)
+        self.last_perms = list(zip(rows, perms))
+        self.deck[rows] = np.take_along_axis(cards, perms, axis=1)
+        self.table[rows] = EMPTY_SLOT
+        self.table[rows, :12] = self.deck[rows, :12]
+        self.table_len[rows] = 12
+        self.head[rows] = 12
+        self.deck_end[rows] = CARD_COUNT
+        self.found[rows] = EMPTY_SLOT
+        self.found_len[rows] = 0
+        self._deal_until_set(rows, need_deck=False)
+
+    def find_set(self):
+        return first_sets(self.table)
+
+    def has_set(self):
+        return self.find_set()[:, 0] >= 0
+
+    def all_sets(self):
+        return find_sets(self.table)
+
+    def take_set(self, picks, mask=None):
+        picks = np.asarray(picks, dtype=np.intp)
+        rows = self._rows(mask)
+        rows = rows[(picks[rows] >= 0).all(axis=1)]
+        n = np.arange(len(rows))[:, None]
+        p = picks[rows]
+        taken = self.table[rows[:, None], p]
+        self.found[rows[:, None], self.found_len[rows, None] + np.arange(3)] = taken
+        self.found_len[rows] += 3
+        without = self.table[rows]
+        without[n, p] = EMPTY_SLOT
+        remove = (self.table_len[rows] >= 15) & (first_sets(without)[:, 0] >= 0) | \
+                 (self.head[rows] == self.deck_end[rows])
+
+        r = rows[remove]
+        order = np.argsort(without[remove] == EMPTY_SLOT, axis=1, kind="stable")
+        self.table[r] = np.take_along_axis(without[remove], order, axis=1)
+        self.table_len[r] -= 3
+
+        k = rows[~remove]
+        self.table[k[:, None], p[~remove]] = self.deck[k[:, None], self.head[k, None] + np.arange(3)]
+        self.head[k] += 3
+        self._deal_until_set(k)
+
+    def flip_found(self, mask=None):
+        rows = self._rows(mask)
+        found_len = self.found_len[rows]
+        keys = self.rng.random((len(rows), CARD_COUNT))
+        keys[np.arange(CARD_COUNT) >= found_len[:, None]] = np.inf
+        perms = np.argsort(keys, axis=1)
+        self.last_perms = [(g, perm[:f]) for g, perm, f in zip(rows, perms, found_len)]
+        found = np.take_along_axis(self.found[rows], perms, axis=1)
+        deck_len = self.deck_size()[rows]
+        self.deck[rows] = _concat_segments([
+            (self.deck[rows], _segment_keys(deck_len, CARD_COUNT, 0, self.head[rows])),
+            (found, _segment_keys(found_len, CARD_COUNT, CARD_COUNT)),
+        ])
+        self.head[rows] = 0
+        self.deck_end[rows] = deck_len + found_len
+        self.found[rows] = EMPTY_SLOT
+        self.found_len[rows] = 0
+        self._deal_until_set(rows)
+
+    def state(self, g):
+        return (self.table[g, :self.table_len[g]].tolist(), self.deck[g, self.head[g]:self.deck_end[g]].tolist(),
+                self.found[g, :self.found_len[g]].tolist())
+
+
+class _ReplayRng:
+    def __init__(self):
+        self.perms = []
+
+    def shuffle(self, x):
+        perm = self.perms.pop(0)
+        x[:] = [x[i] for i in perm]
+
+
+def field_state(field: GameField):
+    return [c.code for c in field.on_table], [c.code for c in field.deck], [c.code for c in field.found_sets]
+
+
+def differential_check(games=200, steps=80, seed=0):
+    batch = BatchField(games, seed)
+    replays = [_ReplayRng() for _ in range(games)]
+
+    def feed():
+        for g, perm in batch.last_perms:
+            replays[g].perms.append(perm.tolist())
+
+    feed()
+    fields = [GameField(replays[g]) for g in range(games)]
+    rng = np.random.default_rng(seed + 1)
+    for step in range(steps):
+        for g in range(games):
+            if batch.state(g) != field_state(fields[g]):
+                raise AssertionError(f"game {g} diverged at step {step}")
+        first = batch.find_set()
+        for g in range(games):
+            expected = fields[g].find_set()
+            if (expected or [-1, -1, -1]) != first[g].tolist():
+                raise AssertionError(f"find_set of game {g} differs at step {step}")
+        if rng.random() < 0.05:
+            mask = rng.random(games) < 0.5
+            batch.shuffle(mask)
+            feed()
+            for g in np.flatnonzero(mask):
+                fields[g].shuffle()
+            continue
+        sets = batch.all_sets()
+        picks = np.full((games, 3), -1, dtype=np.intp)
+        if len(sets):
+            choice = rng.permutation(len(sets))
+            picks[sets[choice, 0]] = sets[choice, 1:]
+            picks = rng.permuted(picks, axis=1)
+        stuck = (picks[:, 0] < 0) & (batch.found_len > 0)
+        batch.take_set(picks)
+        batch.flip_found(stuck)
+        feed()
+        for g in range(games):
+            if picks[g, 0] >= 0:
+                fields[g].take_set(*picks[g].tolist())
+            elif stuck[g]:
+                fields[g].flip_found()
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Step many Set games in lockstep")
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--steps", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--check", action="store_true", help="compare against GameField step by step")
+    args = parser.parse_args()
+    if args.check:
+        differential_check(min(args.games, 500), args.steps, args.seed)
+        print("BatchField matches GameField")
+        return
+    batch = BatchField(args.games, args.seed)
+    start = time.perf_counter()
+    for _ in range(args.steps):
+        batch.take_set(batch.find_set())
+    elapsed = time.perf_counter() - start
+    print(f"{args.games * args.steps / elapsed:.0f} take_set calls per second")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+import argparse
+import copy
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+import cairo
+
+from SetCard import Card, CardRenderCache, render_card
+from SetEngine import CARD_COUNT, find_set_codes
+from SetFieldCanvas import FRAME_MARGIN, FieldGeometry, paint_field
+from SetGameController import DIFFICULTY_SETS
+from SetGameField import GameField, check_set, find_set
+from SetStats import SetSnapshot, StatsRecorder, StatsWorker, search_timing
+
+TABLE_SIZES = [12, 15, 18, 21]
+FIELD_SIZE = (600, 400)
+CARD_SIZES = [(165, 60), (330, 120), (660, 240)]
+BENCHMARKS = {}
+
+
+def benchmark(name, number=1000, files=False):
+    # With files, prepare also gets a directory that is removed when the benchmark run ends
+    def register(prepare):
+        BENCHMARKS[name] = (prepare, number, files)
+        return prepare
+
+    return register
+
+
+def random_table(rng, size):
+    while True:
+        codes = rng.sample(range(CARD_COUNT), size)
+        if find_set_codes(codes) is not None:
+            return codes
+
+
+def make_field(rng, size, found=0):
+    table = random_table(rng, size)
+    rest = [code for code in range(CARD_COUNT) if code not in table]
+    rng.shuffle(rest)
+    deck = rest[found:]
+    return GameField(rng, bytes([size, len(deck), found, *table, *deck, *rest[:found]]))
+
+
+def _register_core(size):
+    @benchmark(f"check_set/{size}", number=10000)
+    def bench_check_set(number, rng):
+        cards = [Card.from_code(code) for code in random_table(rng, size)]
+        triples = [rng.sample(cards, 3) for _ in range(number)]
+        return lambda: [check_set(*t) for t in triples]
+
+    @benchmark(f"find_set/{size}", number=200)
+    def bench_find_set(number, rng):
+        tables = [[Card.from_code(code) for code in random_table(rng, size)] for _ in range(number)]
+        return lambda: [find_set(t) for t in tables]
+
+    @benchmark(f"field.find_set/{size}", number=200)
+    def bench_field_find_set(number, rng):
+        field = make_field(rng, size)
+        return lambda: [field.find_set() for _ in range(number)]
+
+    @benchmark(f"field.take_set/{size}", number=100)
+    def bench_take_set(number, rng):
+        fields = [make_field(rng, size) for _ in range(number)]
+        picks = [f.find_set() for f in fields]
+        return lambda: [f.take_set(*s) for f, s in zip(fields, picks)]
+
+    @benchmark(f"field.flip_found/{size}", number=100)
+    def bench_flip_found(number, rng):
+        fields = [make_field(rng, size, found=30) for _ in range(number)]
+        return lambda: [f.flip_found() for f in fields]
+
+    @benchmark(f"stats.process/{size}", number=256, files=True)
+    def bench_stats_process(number, rng, workdir):
+        # What the stats worker does per found set: snapshot record, CSV row and the chunked flushes
+        worker = StatsWorker(StatsRecorder(os.path.join(tempfile.mkdtemp(dir=workdir), "stats.csv")))
+        timing = search_timing(0, [10 ** 9, 2 * 10 ** 9, 3 * 10 ** 9], 0, 0)
+        batch = []
+        for _ in range(number):
+            codes = tuple(random_table(rng, size))
+            batch.append(SetSnapshot(codes, tuple(find_set_codes(list(codes))), rng.random(), False, False, timing))
+        chunk = worker.recorder.chunk_size
+
+        def run():
+            for start in range(0, number, chunk):
+                worker._process(batch[start:start + chunk])
+            worker.recorder.flush()
+
+        return run
+
+
+for _size in TABLE_SIZES:
+    _register_core(_size)
+
+
+@benchmark("field.shuffle", number=100)
+def bench_shuffle(number, rng):
+    fields = [GameField(rng) for _ in range(number)]
+    return lambda: [f.shuffle() for f in fields]
+
+
+def _register_difficulty(difficulty, sets):
+    @benchmark(f"field.shuffle/{difficulty.name.lower()}", number=100)
+    def bench_shuffle_with_sets(number, rng):
+        fields = [GameField(rng) for _ in range(number)]
+        return lambda: [f.shuffle(sets) for f in fields]
+
+
+for _difficulty, _sets in DIFFICULTY_SETS.items():
+    _register_difficulty(_difficulty, _sets)
+
+
+@benchmark("field.deepcopy", number=100)
+def bench_deepcopy(number, rng):
+    field = make_field(rng, 12)
+    return lambda: [copy.deepcopy(field) for _ in range(number)]
+
+
+@benchmark("field.snapshot", number=1000)
+def bench_snapshot(number, rng):
+    field = make_field(rng, 12, found=30)
+    return lambda: [field.snapshot() for _ in range(number)]
+
+
+@benchmark("field.fork", number=1000)
+def bench_fork(number, rng):
+    field = make_field(rng, 12, found=30)
+    return lambda: [field.fork() for _ in range(number)]
+
+
+def _register_draw(w, h, card_vertical):
+    if card_vertical:
+        w, h = h, w
+
+    @benchmark(f"card.draw/{w}x{h}", number=50)
+    def bench_draw(number, rng):
+        cards = [Card.from_code(rng.randrange(CARD_COUNT)) for _ in range(number)]
+        return lambda: [render_card(card, w, h, card_vertical, lw=w / 100) for card in cards]
+
+    @benchmark(f"card.blit_cached/{w}x{h}", number=50)
+    def bench_blit(number, rng):
+        cache = CardRenderCache()
+        cards = [Card.from_code(rng.randrange(CARD_COUNT)) for _ in range(number)]
+        target = cairo.ImageSurface(cairo.Format.ARGB32, w, h)
+
+        def run():
+            for card in cards:
+                ctx = cairo.Context(target)
+                ctx.set_source_surface(cache.get(card, w, h, card_vertical, lw=w / 100), 0, 0)
+                ctx.paint()
+
+        return run
+
+
+for _w, _h in CARD_SIZES:
+    for _vertical in (False, True):
+        _register_draw(_w, _h, _vertical)
+
+
+def _register_field_paint(size):
+    # The cairo side of a full field redraw: a context per card as each DrawingArea of the grid gets one,
+    # against one pass over a single canvas
+    def prepare(rng):
+        geometry = FieldGeometry(size, False, *FIELD_SIZE)
+        cards = [Card.from_code(code) for code in random_table(rng, size)]
+        cache = CardRenderCache()
+        target = cairo.ImageSurface(cairo.Format.ARGB32, *FIELD_SIZE)
+        paint_field(cairo.Context(target), geometry, cards, [(0.7, 0.7, 0.7)] * size, cache, False)
+        return geometry, cards, cache, target
+
+    @benchmark(f"field.paint_grid/{size}", number=50)
+    def bench_paint_grid(number, rng):
+        geometry, cards, cache, target = prepare(rng)
+
+        def run():
+            for _ in range(number):
+                for i, card in enumerate(cards):
+                    x, y, w, h = geometry.slot_rect(i)
+                    ctx = cairo.Context(target)
+                    ctx.translate(x, y)
+                    ctx.rectangle(0, 0, w, h)
+                    ctx.clip()
+                    ctx.set_source_surface(cache.get(card, w, h, False, lw=w / 200 * 2), 0, 0)
+                    ctx.paint()
+                    m = FRAME_MARGIN * w
+                    ctx.rectangle(m, m, w - 2 * m, h - 2 * m)
+                    ctx.set_source_rgb(0.7, 0.7, 0.7)
+                    ctx.set_line_width(m)
+                    ctx.stroke()
+
+        return run
+
+    @benchmark(f"field.paint_canvas/{size}", number=50)
+    def bench_paint_canvas(number, rng):
+        geometry, cards, cache, target = prepare(rng)
+        frames = [(0.7, 0.7, 0.7)] * size
+
+        def run():
+            for _ in range(number):
+                paint_field(cairo.Context(target), geometry, cards, frames, cache, False)
+
+        return run
+
+
+for _size in TABLE_SIZES:
+    _register_field_paint(_size)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def run_benchmark(name, warmup, repeats, seed):
+    prepare, number, files = BENCHMARKS[name]
+    rng = random.Random(seed)
+    samples = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for rep in range(warmup + repeats):
+            run = prepare(number, rng, workdir) if files else prepare(number, rng)
+            start = time.perf_counter_ns()
+            run()
+            elapsed = (time.perf_counter_ns() - start) / number
+            if rep >= warmup:
+                samples.append(elapsed)
+    return {
+        "unit": "ns/op",
+        "number": number,
+        "repeats": repeats,
+        "mean": statistics.fmean(samples),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "min": min(samples),
+        "p50": percentile(samples, 50),
+        "p90": percentile(samples, 90),
+        "p99": percentile(samples, 99),
+    }
+
+
+def compare(results, baseline, threshold, stat="p50"):
+    regressions = []
+    for name, res in results.items():
+        if name not in baseline:
+            continue
+        ratio = res[stat] / baseline[name][stat]
+        mark = "REGRESSION" if ratio > 1 + threshold else "improved" if ratio < 1 - threshold else ""
+        print(f"{name:32} {baseline[name][stat]:14.1f} -> {res[stat]:14.1f} ns/op  x{ratio:5.2f}  {mark}")
+        if ratio > 1 + threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Set game core and card renderer")
+    parser.add_argument("--filter", default="", help="regex selecting benchmark names")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed relative slowdown")
+    parser.add_argument("--list", action="store_true")
+    args = parser.parse_args()
+    names = [name for name in BENCHMARKS if re.search(args.filter, name)]
+    if args.list:
+        print("\n".join(names))
+        return
+    results = {}
+    for name in names:
+        results[name] = run_benchmark(name, args.warmup, args.repeats, args.seed)
+        res = results[name]
+        print(f"{name:32} p50 {res['p50']:12.1f}  p90 {res['p90']:12.1f}  p99 {res['p99']:12.1f} ns/op",
+              file=sys.stderr)
+    if args.output:
+        json.dump({"python": sys.version, "results": results}, open(args.output, "w"), indent=2)
+    if args.baseline:
+        regressions = compare(results, json.load(open(args.baseline))["results"], args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
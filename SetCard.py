@@ -1,9 +1,16 @@
+from collections import OrderedDict
 from enum import Enum
 from math import pi
+from typing import TYPE_CHECKING
 
-import cairo
+from SetEngine import CARD_COUNT, decode, encode
 
 CARD_ASPECT_RATIO = 1.35
+CARD_SIZE = (330, 120)
+
+# cairo is only imported for drawing, so the card model and the game logic built on it run without pycairo
+if TYPE_CHECKING:
+    import cairo
 
 
 class CardColor(Enum):
@@ -33,7 +40,7 @@ class CardShape(Enum):
     SNAKE = 2
 
 
-def draw_shape_outline(ctx: cairo.Context, shape: CardShape):
+def draw_shape_outline(ctx: "cairo.Context", shape: CardShape):
     if shape == CardShape.RHOMBUS:
         ctx.move_to(0, 50)
         ctx.line_to(50, 0)
@@ -53,7 +60,17 @@ def draw_shape_outline(ctx: cairo.Context, shape: CardShape):
             ctx.translate(-100, -100)
 
 
+_striped_surfaces = {}
+
+
 def get_striped_surface(color: CardColor):
+    if color not in _striped_surfaces:
+        _striped_surfaces[color] = make_striped_surface(color)
+    return _striped_surfaces[color]
+
+
+def make_striped_surface(color: CardColor):
+    import cairo
     s = cairo.ImageSurface(cairo.Format.RGB24, 100, 100)
     ctx = cairo.Context(s)
     ctx.rectangle(0, 0, 100, 100)
@@ -69,19 +86,44 @@ def get_striped_surface(color: CardColor):
 
 
 class Card:
+    __slots__ = ("Shape", "Fill", "Color", "Count", "code")
     Shape: CardShape
     Fill: CardFill
     Color: CardColor
     Count: int
+    code: int
 
-    def __init__(self, shape, fill, color, count):
-        assert 1 <= count <= 3
-        self.Shape = shape
-        self.Fill = fill
-        self.Color = color
-        self.Count = count
+    # There is a single shared instance per card, so cards compare and hash by identity
+    _interned = {}
 
-    def draw(self, ctx: cairo.Context, lw=2, rotate=False):
+    def __new__(cls, shape, fill, color, count):
+        assert 1 <= count <= 3
+        code = encode(shape.value, fill.value, color.value, count)
+        card = cls._interned.get(code)
+        if card is None:
+            card = super().__new__(cls)
+            card.Shape = shape
+            card.Fill = fill
+            card.Color = color
+            card.Count = count
+            card.code = code
+            cls._interned[code] = card
+        return card
+
+    def __reduce__(self):
+        return Card.from_code, (self.code,)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, _memo):
+        return self
+
+    @staticmethod
+    def from_code(code):
+        return CARDS[code]
+
+    def draw(self, ctx: "cairo.Context", lw=2, rotate=False):
         if rotate:
             ctx.rotate(-pi / 2)
             ctx.translate(-330, 0)
@@ -103,3 +145,44 @@ class Card:
         if rotate:
             ctx.translate(330, 0)
             ctx.rotate(pi / 2)
+
+
+def _make_card(code):
+    shape, fill, color, count = decode(code)
+    return Card(CardShape(shape), CardFill(fill), CardColor(color), count)
+
+
+CARDS = tuple(_make_card(code) for code in range(CARD_COUNT))
+
+
+class CardRenderCache:
+    def __init__(self, max_size=128):
+        self.max_size = max_size
+        self.surfaces = OrderedDict()
+
+    def invalidate(self):
+        self.surfaces.clear()
+
+    def get(self, card: Card, w, h, rotate=False, lw=2, scale=1):
+        key = (card.code, w, h, rotate, lw, scale)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = self.surfaces[key] = render_card(card, w, h, rotate, lw, scale)
+            if len(self.surfaces) > self.max_size:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(key)
+        return surface
+
+
+def render_card(card: Card, w, h, rotate=False, lw=2, scale=1):
+    # Drawn at device resolution, so cards stay sharp on HiDPI screens; w and h stay in logical pixels
+    import cairo
+    s = cairo.ImageSurface(cairo.Format.ARGB32, w * scale, h * scale)
+    s.set_device_scale(scale, scale)
+    ctx = cairo.Context(s)
+    wd, hd = CARD_SIZE if not rotate else CARD_SIZE[::-1]
+    ctx.scale(w / wd, h / hd)
+    card.draw(ctx, lw=lw, rotate=rotate)
+    s.flush()
+    return s
@@ -0,0 +1,38 @@
+CARD_COUNT = 81
+ATTR_COUNT = 4
+
+
+def encode(shape, fill, color, count):
+    return shape + 3 * fill + 9 * color + 27 * (count - 1)
+
+
+def decode(code):
+    return code % 3, code // 3 % 3, code // 9 % 3, code // 27 + 1
+
+
+def digits(code):
+    return [code // 3 ** d % 3 for d in range(ATTR_COUNT)]
+
+
+def _third_card(a, b):
+    da, db = digits(a), digits(b)
+    return sum((-(x + y) % 3) * 3 ** d for d, (x, y) in enumerate(zip(da, db)))
+
+
+# THIRD[a][b] is the only card completing a and b to a set (THIRD[a][a] == a)
+THIRD = [[_third_card(a, b) for b in range(CARD_COUNT)] for a in range(CARD_COUNT)]
+
+
+def check_set_codes(a, b, c):
+    return a != b and THIRD[a][b] == c
+
+
+def find_set_codes(codes):
+    pos = {code: idx for idx, code in enumerate(codes)}
+    for i in range(len(codes)):
+        row = THIRD[codes[i]]
+        for j in range(i):
+            k = pos.get(row[codes[j]])
+            if k is not None and k < j:
+                return [i, j, k]
+    return None
@@ -0,0 +1,185 @@
+import argparse
+import json
+import time
+from collections import Counter
+from fractions import Fraction
+from math import comb, prod
+from pathlib import Path
+
+import numpy as np
+
+from SetEngine import ATTR_COUNT, CARD_COUNT, THIRD, digits
+
+CACHE_PATH = "set_enumeration.json"
+FAMILIES = ["cap", "all"]
+
+# Order of AGL(4, 3): translations times GL(4, 3)
+GROUP_ORDER = CARD_COUNT * prod(CARD_COUNT - 3 ** i for i in range(ATTR_COUNT))
+DIGITS = np.array([digits(code) for code in range(CARD_COUNT)], dtype=np.int64)
+
+
+def fixing_flat(d):
+    # Affine maps fixing a d-dimensional flat pointwise
+    return prod(CARD_COUNT - 3 ** i for i in range(d, ATTR_COUNT))
+
+
+def flat_coordinates(codes):
+    # Coordinates of the cards in an affine basis of the flat they span, as an array (k, d)
+    x = DIGITS[list(codes)]
+    diffs = [tuple(v) for v in (x - x[0]) % 3]
+    basis, span = [], {(0,) * ATTR_COUNT: ()}
+    for v in diffs:
+        if v not in span:
+            basis.append(v)
+            span = {tuple((np.array(w) + c * np.array(v)) % 3): coords + (c,)
+                    for w, coords in span.items() for c in range(3)}
+    for w in span:
+        span[w] = span[w] + (0,) * (len(basis) - len(span[w]))
+    return np.array([span[v] for v in diffs], dtype=np.int64).reshape(len(codes), len(basis))
+
+
+def _invariants(codes):
+    pair_thirds = Counter(THIRD[a][b] for n, a in enumerate(codes) for b in codes[:n])
+    point = [tuple(sorted(pair_thirds[THIRD[a][b]] for b in codes if b != a)) for a in codes]
+    return pair_thirds, point
+
+
+def _mod3_inverse(m):
+    det = np.rint(np.linalg.det(m)).astype(np.int64)
+    ok = det % 3 != 0
+    adj = np.rint(np.linalg.inv(m[ok]) * det[ok, None, None]).astype(np.int64)
+    # In GF(3) every non-zero element is its own inverse
+    return ok, adj * (det[ok] % 3)[:, None, None] % 3
+
+
+def canonical_form(codes):
+    codes = sorted(codes)
+    y = flat_coordinates(codes)
+    k, d = y.shape
+    if d == 0:
+        return (0,), fixing_flat(0)
+    local = [int(c) for c in y @ 3 ** np.arange(d)]
+    pair_thirds, point = _invariants(local)
+    first = [i for i in range(k) if point[i] == min(point)]
+    rest = np.indices((k,) * (d - 1)).reshape(d - 1, -1).T if d > 1 else np.zeros((1, 0), dtype=np.int64)
+    frames = []
+    for i0 in first:
+        keys = {i: (pair_thirds[THIRD[local[i0]][local[i]]], point[i]) for i in range(k) if i != i0}
+        second = [i for i in keys if keys[i] == min(keys.values())]
+        for i1 in second:
+            frames.append(np.column_stack([np.full(len(rest), i0), np.full(len(rest), i1), rest]))
+    frames = np.concatenate(frames)
+    m = (y[frames[:, 1:]] - y[frames[:, :1]]) % 3
+    ok, inv = _mod3_inverse(m.astype(np.float64))
+    frames = frames[ok]
+    images = np.einsum("fkd,fde->fke", (y[None] - y[frames[:, 0]][:, None]) % 3, inv) % 3
+    images = np.sort(images @ 3 ** np.arange(d), axis=1)
+    best = images[np.lexsort(images.T[::-1])[0]]
+    stabilizer = int((images == best).all(axis=1).sum())
+    return tuple(int(c) for c in best), stabilizer * fixing_flat(d)
+
+
+def count_sets_in(codes):
+    present = set(codes)
+    return sum(THIRD[a][b] in present for n, a in enumerate(codes) for b in codes[:n]) // 3
+
+
+class Enumeration:
+    def __init__(self, family="cap"):
+        assert family in FAMILIES
+        self.family = family
+        # levels[k] maps canonical forms of k-card orbits to their stabilizer orders
+        self.levels = {1: {(0,): fixing_flat(0)}}
+
+    def extensions(self, rep):
+        blocked = set(rep)
+        if self.family == "cap":
+            blocked.update(THIRD[a][b] for n, a in enumerate(rep) for b in rep[:n])
+        return [c for c in range(CARD_COUNT) if c not in blocked]
+
+    def extend(self):
+        k = max(self.levels)
+        nxt = {}
+        for rep in self.levels[k]:
+            for c in self.extensions(rep):
+                form, stabilizer = canonical_form([*rep, c])
+                nxt.setdefault(form, stabilizer)
+        self.levels[k + 1] = nxt
+        return nxt
+
+    def histogram(self, k):
+        hist = Counter()
+        for rep, stabilizer in self.levels[k].items():
+            hist[count_sets_in(rep)] += GROUP_ORDER // stabilizer
+        return hist
+
+    def dump(self):
+        return {"family": self.family,
+                "levels": {k: [[list(rep), s] for rep, s in orbits.items()] for k, orbits in self.levels.items()},
+                "histograms": {k: dict(self.histogram(k)) for k in self.levels}}
+
+    @staticmethod
+    def load(data):
+        e = Enumeration(data["family"])
+        e.levels = {int(k): {tuple(rep): s for rep, s in orbits} for k, orbits in data["levels"].items()}
+        return e
+
+
+def load_cache(path=CACHE_PATH):
+    path = Path(path)
+    return json.load(open(path)) if path.exists() else {}
+
+
+def save_cache(enumeration: Enumeration, path=CACHE_PATH):
+    cache = load_cache(path)
+    cache[enumeration.family] = enumeration.dump()
+    json.dump(cache, open(path, "w"))
+
+
+def cached_histogram(family, k, path=CACHE_PATH):
+    histograms = load_cache(path).get(family, {}).get("histograms", {})
+    if str(k) not in histograms:
+        raise KeyError(f"no cached counts for {k} cards, run SetEnumeration.py --family {family} --max-size {k}")
+    return {int(sets): n for sets, n in histograms[str(k)].items()}
+
+
+def no_set_probability(k, path=CACHE_PATH):
+    if k == 0:
+        return Fraction(1)
+    return Fraction(cached_histogram("cap", k, path).get(0, 0), comb(CARD_COUNT, k))
+
+
+def set_count_distribution(k, path=CACHE_PATH):
+    return {sets: Fraction(n, comb(CARD_COUNT, k)) for sets, n in sorted(cached_histogram("all", k, path).items())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exact Set deal statistics by enumerating orbits under AGL(4, 3)")
+    parser.add_argument("--family", choices=FAMILIES, default="cap",
+                        help="cap: card sets without a Set, all: every card set with its Set count")
+    parser.add_argument("--max-size", type=int, default=20)
+    parser.add_argument("--cache", default=CACHE_PATH)
+    args = parser.parse_args()
+    cached = load_cache(args.cache).get(args.family)
+    enumeration = Enumeration.load(cached) if cached else Enumeration(args.family)
+    while max(enumeration.levels) < args.max_size and enumeration.levels[max(enumeration.levels)]:
+        start = time.perf_counter()
+        orbits = enumeration.extend()
+        k = max(enumeration.levels)
+        hist = enumeration.histogram(k)
+        total = sum(hist.values())
+        print(f"{k:2} cards: {len(orbits)} orbits, {total} card sets ({time.perf_counter() - start:.1f} s)")
+        if args.family == "all" and total != comb(CARD_COUNT, k):
+            raise AssertionError(f"orbit sizes add up to {total}, expected {comb(CARD_COUNT, k)}")
+        save_cache(enumeration, args.cache)
+    for k in sorted(enumeration.levels):
+        hist = enumeration.histogram(k)
+        if args.family == "cap":
+            print(f"P(no Set among {k} cards) = {float(Fraction(hist[0], comb(CARD_COUNT, k))):.6g}")
+        else:
+            dist = ", ".join(f"{s}: {float(Fraction(n, comb(CARD_COUNT, k))):.4g}" for s, n in sorted(hist.items()))
+            print(f"{k} cards, Sets on table: {dist}")
+
+
+if __name__ == "__main__":
+    main()
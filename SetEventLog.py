@@ -0,0 +1,100 @@
+import atexit
+import datetime as dt
+import os
+import struct
+import time
+from enum import IntEnum
+from pathlib import Path
+
+MAGIC = b"SETLOG\x00\x01"
+HEADER = struct.Struct("<8sQ")
+RECORD = struct.Struct("<QBB3B3x")
+NO_SLOT = NO_CARD = 255
+LOG_SUFFIX = ".setlog"
+
+
+class Event(IntEnum):
+    DEAL = 1
+    SELECT = 2
+    DESELECT = 3
+    HINT = 4
+    SET_TAKEN = 5
+    SHUFFLE = 6
+    FLIP_FOUND = 7
+    GAME_OVER = 8
+    MISS = 9
+    # A card moved to another slot when a taken set was not replaced and the table closed up
+    MOVE = 10
+
+
+class EventLog:
+    def __init__(self, path, flush_every=64):
+        self.path = Path(path)
+        self.flush_every = flush_every
+        self.buffer = bytearray()
+        self.pending = 0
+        self.file = None
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(HEADER.pack(MAGIC, time.time_ns() - time.monotonic_ns()))
+        atexit.register(self.close)
+
+    def write(self, event: Event, cards=(), slot=NO_SLOT, t=None):
+        codes = [*cards, NO_CARD, NO_CARD, NO_CARD]
+        t = time.monotonic_ns() if t is None else t
+        self.buffer += RECORD.pack(t, event, slot, codes[0], codes[1], codes[2])
+        self.pending += 1
+        if self.pending >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if self.pending == 0:
+            return
+        if self.file is None:
+            self._open()
+        self.file.write(self.buffer)
+        self.file.flush()
+        self.buffer.clear()
+        self.pending = 0
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            atexit.unregister(self.close)
+
+
+def session_log(directory):
+    name = f"{dt.datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}{LOG_SUFFIX}"
+    return EventLog(Path(directory) / name)
+
+
+def record_dtype():
+    import numpy as np
+    return np.dtype([("t", "<u8"), ("event", "u1"), ("slot", "u1"), ("cards", "u1", 3), ("pad", "V3")])
+
+
+def read_log(path):
+    import numpy as np
+    with open(path, "rb") as f:
+        magic, clock_offset = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a Set event log")
+    # A session killed mid-write can leave a partial record at the end
+    count = (os.path.getsize(path) - HEADER.size) // RECORD.size
+    if count == 0:
+        return np.zeros(0, dtype=record_dtype()), clock_offset
+    return np.memmap(path, dtype=record_dtype(), mode="r", offset=HEADER.size, shape=(count,)), clock_offset
+
+
+def iter_logs(paths):
+    for path in paths:
+        path = Path(path)
+        files = sorted(path.glob("*" + LOG_SUFFIX)) if path.is_dir() else [path]
+        for file in files:
+            records, clock_offset = read_log(file)
+            yield file, records, clock_offset
@@ -0,0 +1,116 @@
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from SetBatch import DIGITS, EMPTY_SLOT, count_sets
+from SetStats import CARD_ATTRS, NO_CARD, SNAPSHOT_TABLE, TRAIT_OPTIONS, pack_snapshot
+
+# Same layout as SetStats.SNAPSHOT_RECORD
+SNAPSHOT_DTYPE = np.dtype([("codes", "u1", SNAPSHOT_TABLE), ("picks", "u1", 3), ("time", "<f8"), ("is_rand", "u1"),
+                           ("is_hint", "u1")])
+FEATURES = {}
+
+
+def feature(name):
+    def register(fn):
+        FEATURES[name] = fn
+        return fn
+
+    return register
+
+
+def pack_snapshots(snapshots):
+    return np.frombuffer(b"".join(pack_snapshot(s) for s in snapshots), dtype=SNAPSHOT_DTYPE)
+
+
+def load_snapshots(path):
+    count = Path(path).stat().st_size // SNAPSHOT_DTYPE.itemsize
+    return np.memmap(path, dtype=SNAPSHOT_DTYPE, mode="r", shape=(count,)) if count else \
+        np.zeros(0, dtype=SNAPSHOT_DTYPE)
+
+
+def unpack_tables(records):
+    tables = records["codes"].astype(np.intp)
+    tables[tables == NO_CARD] = EMPTY_SLOT
+    return tables, records["picks"].astype(np.intp)
+
+
+def _table_digits(tables):
+    # (N, slots, attrs), with -1 for the digits of empty slots
+    return np.where(tables[..., None] >= 0, DIGITS[np.maximum(tables, 0)], -1)
+
+
+@feature("traits")
+def trait_features(tables, picks):
+    d = _table_digits(tables)
+    rows = np.arange(len(tables))[:, None]
+    chosen = d[rows, picks]
+    out = {}
+    for a, (attr, options) in enumerate(zip(CARD_ATTRS, TRAIT_OPTIONS)):
+        for v, opt in enumerate(options):
+            out[opt] = (d[..., a] == v).sum(axis=1)
+        same = (chosen[:, 0, a] == chosen[:, 1, a]) & (chosen[:, 1, a] == chosen[:, 2, a])
+        out["Set." + attr] = np.where(same, chosen[:, 0, a] + (attr == "Count"), -1)
+    return out
+
+
+@feature("table")
+def table_features(tables, _picks):
+    return {"TableSize": (tables >= 0).sum(axis=1), "SetsAvailable": count_sets(tables)}
+
+
+@feature("similarity")
+def similarity_features(tables, picks):
+    chosen = _table_digits(tables)[np.arange(len(tables))[:, None], picks]
+    out = {}
+    for p, q in ((0, 1), (0, 2), (1, 2)):
+        out[f"Similarity.{p}{q}"] = (chosen[:, p] == chosen[:, q]).sum(axis=1)
+    out["SameTraits"] = ((chosen[:, 0] == chosen[:, 1]) & (chosen[:, 1] == chosen[:, 2])).sum(axis=1)
+    return out
+
+
+@feature("position")
+def position_features(_tables, picks):
+    # In the horizontal field layout slot i is drawn at row i % 3 and column i // 3
+    rows, cols = picks % 3, picks // 3
+    out = {}
+    for n in range(3):
+        out[f"Row.{n}"] = rows[:, n]
+        out[f"Column.{n}"] = cols[:, n]
+    out["RowSpread"] = rows.max(axis=1) - rows.min(axis=1)
+    out["ColumnSpread"] = cols.max(axis=1) - cols.min(axis=1)
+    return out
+
+
+def extract_features(tables, picks, names=None):
+    tables = np.asarray(tables, dtype=np.intp)
+    picks = np.asarray(picks, dtype=np.intp)
+    out = {}
+    for name in names or FEATURES:
+        out.update(FEATURES[name](tables, picks))
+    return out
+
+
+def main():
+    import pandas as pd
+    parser = argparse.ArgumentParser(description="Compute set features from recorded table snapshots")
+    parser.add_argument("paths", nargs="+", help="snapshot files written next to the stats CSV")
+    parser.add_argument("--features", default=",".join(FEATURES), help="comma-separated feature groups")
+    parser.add_argument("--output", required=True, help="CSV file to write")
+    parser.add_argument("--chunk", type=int, default=1 << 20)
+    args = parser.parse_args()
+    names = args.features.split(",")
+    header = True
+    for path in args.paths:
+        records = load_snapshots(path)
+        for start in range(0, len(records), args.chunk):
+            chunk = records[start:start + args.chunk]
+            cols = extract_features(*unpack_tables(chunk), names)
+            cols.update({"Time": chunk["time"], "IsRand": chunk["is_rand"], "IsHint": chunk["is_hint"]})
+            pd.DataFrame(cols).to_csv(args.output, index=False, mode="w" if header else "a", header=header)
+            header = False
+
+
+if __name__ == "__main__":
+    main()
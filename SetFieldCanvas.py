@@ -0,0 +1,78 @@
+from SetCard import CardRenderCache
+
+# Same gap between cards as the Gtk.Grid of the per-card renderer
+FIELD_SPACING = 15
+FRAME_MARGIN = 0.015
+
+
+def slot_position(i, field_vertical):
+    x = i % 3
+    y = (i - x) // 3
+    return (x, y) if field_vertical else (y, x)
+
+
+def cell_slot(left, top, field_vertical):
+    return top * 3 + left if field_vertical else left * 3 + top
+
+
+def frame_border(w):
+    # The frame is stroked with width m around an inset of m, so it stays within 2m of the edge
+    return int(FRAME_MARGIN * w * 2) + 2
+
+
+class FieldGeometry:
+    # Card rectangles of a whole field drawn on one canvas, laid out like the cells of a homogeneous grid
+    def __init__(self, slots, field_vertical, width, height, spacing=FIELD_SPACING):
+        self.slots = slots
+        self.field_vertical = field_vertical
+        lines = max(slots // 3, 1)
+        self.columns, self.rows = (3, lines) if field_vertical else (lines, 3)
+        self.step_x = (width + spacing) / self.columns
+        self.step_y = (height + spacing) / self.rows
+        self.cell_w = max(int(self.step_x - spacing), 1)
+        self.cell_h = max(int(self.step_y - spacing), 1)
+
+    def slot_rect(self, i):
+        left, top = slot_position(i, self.field_vertical)
+        return int(left * self.step_x), int(top * self.step_y), self.cell_w, self.cell_h
+
+    @staticmethod
+    def _line_at(v, step, cell, lines):
+        # Cells start at whole pixels, so a point just before step * (n + 1) may already be in cell n + 1
+        n = int(v // step)
+        if int((n + 1) * step) <= v:
+            n += 1
+        if not 0 <= n < lines or v - int(n * step) >= cell:
+            return None
+        return n
+
+    def slot_at(self, x, y):
+        left = self._line_at(x, self.step_x, self.cell_w, self.columns)
+        top = self._line_at(y, self.step_y, self.cell_h, self.rows)
+        if left is None or top is None:
+            return None
+        i = cell_slot(left, top, self.field_vertical)
+        return i if i < self.slots else None
+
+    def frame_rects(self, i):
+        x, y, w, h = self.slot_rect(i)
+        b = frame_border(w)
+        return [(x, y, w, b), (x, y + h - b, w, b), (x, y, b, h), (x + w - b, y, b, h)]
+
+
+def paint_field(ctx, geometry: FieldGeometry, cards, frames, cache: CardRenderCache, card_vertical, clip=None,
+                scale=1):
+    # cards[i] is None for slots drawn as empty frames
+    for i, (card, rgb) in enumerate(zip(cards, frames)):
+        x, y, w, h = geometry.slot_rect(i)
+        if clip is not None and (x >= clip[2] or y >= clip[3] or x + w <= clip[0] or y + h <= clip[1]):
+            continue
+        if card is not None:
+            ctx.set_source_surface(cache.get(card, w, h, card_vertical, lw=w / 200 * 2, scale=scale), x, y)
+            ctx.rectangle(x, y, w, h)
+            ctx.fill()
+        m = FRAME_MARGIN * w
+        ctx.rectangle(x + m, y + m, w - 2 * m, h - 2 * m)
+        ctx.set_source_rgb(*rgb)
+        ctx.set_line_width(m)
+        ctx.stroke()
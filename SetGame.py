@@ -1,11 +1,20 @@
 from SetGameField import GameField
-from SetGameView import GameView, FieldLayout
-from SetGameController import GameController, GameMode, GameLim
+from SetGameView import CanvasGameView, GameView, FieldLayout
+from SetGameController import MAX_TARGET_SETS, Difficulty, GameController, GameMode, GameLim
+from SetEventLog import session_log
+from SetMetrics import METRICS
+from SetSolver import EndgameSolver
 import json
+import time
 from pathlib import Path
 
 DEFAULT_SETTINGS = {"mode": 1, "shuffle": False, "field_v": False, "card_v": False, "stats": True, "stats_path": "stats.csv",
-                    "disable_hint": True}
+                    "disable_hint": True, "events": True, "events_dir": "events", "difficulty": 0, "sets": None,
+                    "metrics": False, "metrics_path": "metrics.jsonl", "renderer": "grid"}
+RENDERERS = {"grid": GameView, "canvas": CanvasGameView}
+# Seconds the solver may think per frame for an optimal hint in FIND_ALL mode, and its transposition table size
+HINT_SLICE = 0.004
+HINT_ENTRIES = 1 << 13
 
 
 class Settings:
@@ -14,16 +23,27 @@ class Settings:
         if path is not None and Path(path).exists():
             settings.update(json.load(open(path)))
         settings.update(kw)
-        self.mode = GameMode(GameLim(settings["mode"]), settings["shuffle"])
+        self.mode = GameMode(GameLim(settings["mode"]), settings["shuffle"], Difficulty(settings["difficulty"]),
+                             settings["sets"])
         self.stats_collect = settings["stats"]
         self.stats_path = settings["stats_path"]
         self.field_layout = FieldLayout(settings["field_v"], settings["card_v"])
         self.card_layout = settings["card_v"]
         self.disable_hint = settings["disable_hint"]
+        self.events_log = settings["events"]
+        self.events_dir = settings["events_dir"]
+        self.metrics = settings["metrics"]
+        self.metrics_path = settings["metrics_path"]
+        self.renderer = settings["renderer"]
+        self.correct()
 
     def correct(self):
         if self.mode.limit == GameLim.FIND_ALL and self.mode.shuffle:
             self.mode.shuffle = False
+        if self.mode.sets_target is not None:
+            self.mode.sets_target = min(max(self.mode.sets_target, 1), MAX_TARGET_SETS)
+        if self.renderer not in RENDERERS:
+            self.renderer = DEFAULT_SETTINGS["renderer"]
 
     def dump(self):
         return {
@@ -33,7 +53,14 @@ class Settings:
             "stats_path": self.stats_path,
             "field_v": self.field_layout.field_vertical,
             "card_v": self.field_layout.card_vertical,
-            "disable_hint": self.disable_hint
+            "disable_hint": self.disable_hint,
+            "events": self.events_log,
+            "events_dir": self.events_dir,
+            "difficulty": self.mode.difficulty.value,
+            "sets": self.mode.sets_target,
+            "metrics": self.metrics,
+            "metrics_path": self.metrics_path,
+            "renderer": self.renderer
         }
 
     def to_file(self, path):
@@ -41,9 +68,10 @@ class Settings:
 
 
 class Game:
-    def __init__(self, frame, settings: Settings, game_over_callback=None):
+    def __init__(self, frame, settings: Settings, game_over_callback=None, scheduler=None):
         fd = GameField()
-        self.controller = GameController(fd, settings.mode, settings.stats_collect)
+        events = session_log(settings.events_dir) if settings.events_log else None
+        self.controller = GameController(fd, settings.mode, settings.stats_collect, settings.stats_path, events)
 
         def on_set_found(*indices):
             self.controller.take_set(*indices)
@@ -51,23 +79,66 @@ class Game:
                 self.view.set_active(False)
                 self.game_over_callback(self.controller.status())
 
-        self.view = GameView(fd, frame, settings.field_layout, on_set_found)
-        self.view.set_active(False)
+        self.on_set_found = on_set_found
+        self.frame = frame
+        self.scheduler = scheduler
+        self.solver = EndgameSolver(HINT_ENTRIES)
+        self.view = self.make_view(RENDERERS.get(settings.renderer, GameView), settings.field_layout, False)
         if game_over_callback is not None:
             self.game_over_callback = game_over_callback
         else:
             self.game_over_callback = lambda _caption: None
 
+    def make_view(self, view_class, layout, active):
+        view = view_class(self.controller.field, self.frame, layout, self.on_set_found, self.controller.log_event,
+                          self.scheduler)
+        view.set_active(active)
+        return view
+
     def show_hint(self):
-        self.view.hint_set()
-        self.controller.mark_hint()
+        s = None
+        if self.controller.mode.limit == GameLim.FIND_ALL and self.view.active:
+            # Without shuffles the deck order decides the rest of the game, so hint a set that keeps it longest
+            s = self.solve_hint()
+        self.view.hint_set(s)
+        self.controller.mark_hint(s)
+
+    def solve_hint(self):
+        start = time.perf_counter_ns()
+        result = self.solver.solve(self.controller.field, HINT_SLICE)
+        METRICS.record("field.solve", time.perf_counter_ns() - start)
+        if not result.exact and self.scheduler is not None:
+            snapshot = self.controller.field.snapshot()
+            self.scheduler.request("hint", lambda: self.refine_hint(snapshot, result.move))
+        return result.move
+
+    def refine_hint(self, snapshot, move):
+        # One more slice per frame while the table stays the same; finished subtrees stay in the solver's table
+        if not self.view.active or self.controller.field.snapshot() != snapshot:
+            return
+        better = self.solve_hint()
+        if better is not None and sorted(better) != sorted(move):
+            self.view.clear_hint()
+            self.view.hint_set(better)
+            # Logged like the first hint, so the event log shows the set the player actually sees
+            self.controller.mark_hint(better)
 
     def restart(self):
         self.controller.restart()
         self.view.set_active(True)
         self.view.make_canvases_for_cards()
 
+    def close(self):
+        self.controller.stats.close()
+        if self.controller.events is not None:
+            self.controller.events.close()
+
     def update_settings(self, settings: Settings):
+        view_class = RENDERERS.get(settings.renderer, GameView)
+        if type(self.view) is not view_class:
+            self.view.detach()
+            self.view = self.make_view(view_class, settings.field_layout, self.view.active)
         self.view.set_layout(settings.field_layout)
         self.controller.collect_stats = settings.stats_collect
+        self.controller.stats.set_path(settings.stats_path)
         self.controller.mode = settings.mode
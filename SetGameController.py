@@ -1,35 +1,12 @@
 import datetime as dt
+import time
+from array import array
 from enum import Enum
-from pathlib import Path
-
-from pandas import DataFrame, Series, concat, Float64Dtype
 
+from SetEventLog import NO_SLOT, Event, EventLog
 from SetGameField import GameField
-
-CARD_ATTRS = ["Shape", "Fill", "Color", "Count"]
-data = DataFrame()
-
-
-def write_stats(path):
-    data.transpose().to_csv(path, index=False, mode="a", header=not Path(path).exists())
-
-
-def get_set_context(field: GameField, i, j, k):
-    ctx = Series(dtype=Float64Dtype)
-    for attr in CARD_ATTRS:
-        traits = [card.__getattribute__(attr) for card in field.on_table]
-        if attr == "Count":
-            options = [1, 2, 3]
-            prefix = "Count."
-            val = traits[i]
-        else:
-            options = [*iter(type(traits[0]))]
-            prefix = ""
-            val = traits[i].value
-        for opt in options:
-            ctx[prefix + str(opt)] = len([tr for tr in traits if tr == opt])
-        ctx["Set." + attr] = val if traits[i] == traits[j] == traits[k] else -1
-    return ctx
+from SetMetrics import METRICS
+from SetStats import SetSnapshot, StatsRecorder, StatsWorker, search_timing
 
 
 class GameLim(Enum):
@@ -46,21 +23,78 @@ class GameLim(Enum):
             return "Find ten"
 
 
+class Difficulty(Enum):
+    ANY = 0
+    EASY = 1
+    MEDIUM = 2
+    HARD = 3
+
+    def __str__(self):
+        return self.name.capitalize()
+
+
+# Sets on a freshly dealt 12-card table; about 29%, 53% and 14% of random tables fall into these bands
+DIFFICULTY_SETS = {Difficulty.EASY: (4, 22), Difficulty.MEDIUM: (2, 3), Difficulty.HARD: (1, 1)}
+# Higher exact targets are too rare for rejection sampling to stay under a millisecond
+MAX_TARGET_SETS = 6
+
+
 class GameMode:
-    def __init__(self, lim, shuffle):
+    def __init__(self, lim, shuffle, difficulty=Difficulty.ANY, sets_target=None):
         self.limit = lim
         self.shuffle = shuffle
+        self.difficulty = difficulty
+        self.sets_target = sets_target
+
+    def sets(self):
+        if self.sets_target:
+            target = min(max(self.sets_target, 1), MAX_TARGET_SETS)
+            return target, target
+        return DIFFICULTY_SETS.get(self.difficulty)
 
 
 class GameController:
-    def __init__(self, field: GameField, mode: GameMode, collect_stats=True):
+    def __init__(self, field: GameField, mode: GameMode, collect_stats=True, stats_path="stats.csv",
+                 events: EventLog = None):
         self.field = field
         self.mode = mode
-        self.set_found_timestamp = self.game_start_timestamp = self.game_end_timestamp = dt.datetime.now()
+        # Monotonic nanoseconds, so that clock adjustments don't show up in the stats
+        self.game_start_timestamp = self.game_end_timestamp = time.monotonic_ns()
+        self.start_search()
         self.cards_shuffled = True
         self.counter = 0
         self.hint_used = False
         self.collect_stats = collect_stats
+        self.stats = StatsWorker(StatsRecorder(stats_path))
+        self.events = events
+
+    def start_search(self):
+        self.search_start = time.monotonic_ns()
+        self.clicks = array("q")
+        self.deselects = self.wrong_attempts = 0
+        self.hint_timestamp = None
+
+    def log_event(self, event: Event, cards=(), slot=NO_SLOT, t=None):
+        t = time.monotonic_ns() if t is None else t
+        if event == Event.SELECT or event == Event.DESELECT:
+            self.clicks.append(t)
+            self.deselects += event == Event.DESELECT
+        elif event == Event.MISS:
+            self.wrong_attempts += 1
+        if self.events is not None:
+            self.events.write(event, [card.code for card in cards], slot, t)
+
+    def log_deal(self, before=None):
+        if self.events is not None:
+            for slot, card in enumerate(self.field.on_table):
+                if before is None or card.code not in before:
+                    self.events.write(Event.DEAL, (card.code,), slot)
+
+    def log_moves(self, slots):
+        if self.events is not None:
+            for slot, card in enumerate(self.field.on_table):
+                if slots.get(card.code, slot) != slot:
+                    self.events.write(Event.MOVE, (card.code,), slot)
 
     def is_game_played(self):
         return self.game_end_timestamp is None
@@ -69,45 +103,78 @@ class GameController:
         if not self.is_game_played():
             return
         if self.collect_stats:
-            ctx = get_set_context(self.field, i, j, k)
-            ctx["Time"] = (dt.datetime.now() - self.set_found_timestamp).total_seconds()
-            ctx["IsRand"] = int(self.cards_shuffled)
-            ctx["IsHint"] = int(self.hint_used)
-            global data
-            data = concat([data, ctx], axis=1)
+            timing = search_timing(self.search_start, self.clicks, self.deselects, self.wrong_attempts,
+                                   self.hint_timestamp)
+            self.stats.submit(SetSnapshot(tuple(card.code for card in self.field.on_table), (i, j, k),
+                                          (time.monotonic_ns() - self.search_start) / 1e9, self.cards_shuffled,
+                                          self.hint_used, timing))
+        self.log_event(Event.SET_TAKEN, [self.field[idx] for idx in (i, j, k)])
+        before = {card.code: idx for idx, card in enumerate(self.field.on_table)}
+        start = time.perf_counter_ns()
         self.field.take_set(i, j, k)
+        METRICS.record("field.take_set", time.perf_counter_ns() - start)
+        if len(self.field) < len(before):
+            self.log_moves(before)
         self.counter += 1
         if self.mode.shuffle:
-            self.field.shuffle()
+            self.field.shuffle(self.mode.sets())
+            self.log_event(Event.SHUFFLE)
+            before = None
         self.cards_shuffled = self.mode.shuffle
-        self.set_found_timestamp = dt.datetime.now()
+        self.start_search()
         self.hint_used = False
         if self.mode.limit == GameLim.FIND_ALL:
-            if self.field.find_set() is None:
-                self.game_end_timestamp = dt.datetime.now()
+            if not self.field.has_set():
+                self.game_end_timestamp = time.monotonic_ns()
         elif self.mode.limit == GameLim.FIND_TEN:
             if self.counter >= 10:
-                self.game_end_timestamp = dt.datetime.now()
+                self.game_end_timestamp = time.monotonic_ns()
         elif self.mode.limit == GameLim.INFINITE:
-            if len(self.field.deck) == 0:
-                self.field.shuffle()
+            if self.field.deck_size() == 0:
+                self.field.shuffle(self.mode.sets())
+                self.log_event(Event.SHUFFLE)
+                before = None
+        self.log_deal(before)
+        if not self.is_game_played():
+            self.log_event(Event.GAME_OVER)
+            if self.events is not None:
+                self.events.flush()
 
     def status(self):
         suffix = "/∞" if self.mode.limit == GameLim.INFINITE else \
             "/10" if self.mode.limit == GameLim.FIND_TEN else \
-            f", {len(self.field.deck)} cards left in deck"
-        t = (dt.datetime.now() - self.game_start_timestamp) if self.game_end_timestamp is None else (
-                self.game_end_timestamp - self.game_start_timestamp)
-        t -= dt.timedelta(microseconds=t.microseconds)
-        return f"Sets found: {self.counter}{suffix}; Time elapsed: {t}"
+            f", {self.field.deck_size()} cards left in deck"
+        end = time.monotonic_ns() if self.game_end_timestamp is None else self.game_end_timestamp
+        t = dt.timedelta(seconds=(end - self.game_start_timestamp) // 10 ** 9)
+        # The chosen difficulty could not be dealt, the table is the closest one found
+        band = "; closest table to the difficulty dealt" if self.field.off_band else ""
+        return f"Sets found: {self.counter}{suffix}; Time elapsed: {t}{band}"
 
     def restart(self):
         self.counter = 0
         self.cards_shuffled = True
         self.hint_used = False
-        self.set_found_timestamp = self.game_start_timestamp = dt.datetime.now()
+        self.game_start_timestamp = time.monotonic_ns()
         self.game_end_timestamp = None
-        self.field.shuffle()
-
-    def mark_hint(self):
+        self.start_search()
+        self.field.shuffle(self.mode.sets())
+        self.log_event(Event.SHUFFLE)
+        self.log_deal()
+
+    def flip_found(self):
+        before = {card.code for card in self.field.on_table}
+        self.field.flip_found()
+        self.log_event(Event.FLIP_FOUND)
+        self.log_deal(before)
+
+    def mark_hint(self, s=None):
+        t = time.monotonic_ns()
         self.hint_used = True
+        if self.hint_timestamp is None:
+            self.hint_timestamp = t
+        if s is None:
+            start = time.perf_counter_ns()
+            s = self.field.find_set()
+            METRICS.record("field.find_set", time.perf_counter_ns() - start)
+        if s is not None:
+            self.log_event(Event.HINT, [self.field[idx] for idx in s], t=t)
@@ -1,74 +1,205 @@
 import random
 
-from SetCard import Card, CardColor, CardFill, CardShape
+from SetCard import CARDS, Card
+from SetEngine import CARD_COUNT, THIRD, check_set_codes, find_set_codes
+
+# Tables drawn before a constrained deal gives up and falls back to a plain shuffle
+MAX_DEAL_ATTEMPTS = 20000
 
 
 def check_set(c1: Card, c2: Card, c3: Card):
-    return (c1.Color == c2.Color == c3.Color or c1.Color != c2.Color != c3.Color != c1.Color) and \
-           (c1.Fill == c2.Fill == c3.Fill or c1.Fill != c2.Fill != c3.Fill != c1.Fill) and \
-           (c1.Shape == c2.Shape == c3.Shape or c1.Shape != c2.Shape != c3.Shape != c1.Shape) and \
-           (c1.Count == c2.Count == c3.Count or c1.Count != c2.Count != c3.Count != c1.Count) and \
-           (c1 != c2)
+    return check_set_codes(c1.code, c2.code, c3.code)
 
 
 def find_set(collection):
-    le = len(collection)
-    for i in range(le):
-        for j in range(i):
-            for k in range(j):
-                if check_set(collection[i], collection[j], collection[k]):
-                    return [i, j, k]
-    return None
+    return find_set_codes([card.code for card in collection])
 
 
 class GameField:
-    def __init__(self):
+    def __init__(self, rng=None, snapshot=None):
+        self.rng = random if rng is None else rng
         self.on_table = []
-        self.found_sets = []
-        self.deck = [Card(sh, f, col, ct) for ct in range(1, 4) for col in CardColor for f in CardFill for sh in
-                     CardShape]
-        self.shuffle()
-
-    def shuffle(self):
-        self.deck.extend(self.found_sets)
-        self.deck.extend(self.on_table)
+        # Deck cards are _deck[_head:], found cards are _found, both as card codes
+        self._deck = bytearray(range(CARD_COUNT))
+        self._head = 0
+        self._found = bytearray()
+        self._positions = {}
+        self._sets = set()
+        self._sets_by_card = {}
+        # Set when the last constrained shuffle could not deal a table within the requested band
+        self.off_band = False
+        if snapshot is None:
+            self.shuffle()
+        else:
+            self.restore(snapshot)
+
+    # Read-only views: tuples, so that code still mutating these lists fails instead of changing a copy
+    @property
+    def deck(self):
+        return tuple(CARDS[code] for code in self._deck[self._head:])
+
+    @property
+    def found_sets(self):
+        return tuple(CARDS[code] for code in self._found)
+
+    def deck_size(self):
+        return len(self._deck) - self._head
+
+    def found_size(self):
+        return len(self._found)
+
+    def snapshot(self):
+        table = bytes(card.code for card in self.on_table)
+        deck = self._deck[self._head:]
+        return bytes((len(table), len(deck), len(self._found))) + table + deck + self._found
+
+    def restore(self, snapshot):
+        n_table, n_deck, _n_found = snapshot[:3]
+        deck_start = 3 + n_table
+        self.on_table[:] = [CARDS[code] for code in snapshot[3:deck_start]]
+        self._deck = bytearray(snapshot[deck_start:deck_start + n_deck])
+        self._head = 0
+        self._found = bytearray(snapshot[deck_start + n_deck:])
+        self._index_reset()
+
+    def fork(self, rng=None):
+        return GameField(self.rng if rng is None else rng, self.snapshot())
+
+    def _index_add(self, card, idx):
+        code = card.code
+        row = THIRD[code]
+        self._sets_by_card[code] = set()
+        for other in self._positions:
+            third = row[other]
+            if third in self._positions:
+                triple = frozenset((code, other, third))
+                if triple not in self._sets:
+                    self._sets.add(triple)
+                    for member in triple:
+                        self._sets_by_card[member].add(triple)
+        self._positions[code] = idx
+
+    def _index_remove(self, card):
+        code = card.code
+        del self._positions[code]
+        for triple in self._sets_by_card.pop(code):
+            self._sets.discard(triple)
+            for member in triple:
+                if member != code:
+                    self._sets_by_card[member].discard(triple)
+
+    def _index_reset(self):
+        self._positions.clear()
+        self._sets.clear()
+        self._sets_by_card.clear()
+        for idx, card in enumerate(self.on_table):
+            self._index_add(card, idx)
+
+    def _deal(self, n):
+        for code in self._deck[self._head:self._head + n]:
+            card = CARDS[code]
+            self._index_add(card, len(self.on_table))
+            self.on_table.append(card)
+        self._head += n
+
+    def _order_with_sets(self, codes, lo, hi):
+        # Rejection sampling over uniformly random 12-card tables, which keeps the deal uniform
+        # among the tables with lo..hi sets. The table is drawn card by card with a partial
+        # Fisher-Yates shuffle and dropped as soon as it has more than hi sets.
+        # Returns False if no table within the band turned up; the closest full table drawn is dealt then.
+        present = bytearray(CARD_COUNT)
+        n = len(codes)
+        closest = None
+        for _attempt in range(MAX_DEAL_ATTEMPTS):
+            sets = 0
+            for i in range(12):
+                j = self.rng.randrange(i, n)
+                codes[i], codes[j] = codes[j], codes[i]
+                row = THIRD[codes[i]]
+                # Every new set is counted twice, once for each of its earlier cards
+                sets += sum(present[row[b]] for b in codes[:i])
+                present[codes[i]] = 1
+                if sets > 2 * hi:
+                    break
+            for code in codes[:i + 1]:
+                present[code] = 0
+            if 2 * lo <= sets <= 2 * hi:
+                in_band = True
+                break
+            if i == 11:
+                miss = 2 * lo - sets if sets < 2 * lo else sets - 2 * hi
+                if closest is None or miss < closest[0]:
+                    closest = miss, codes[:12]
+        else:
+            in_band = False
+            if closest is None:
+                self.rng.shuffle(codes)
+                return in_band
+            table = set(closest[1])
+            codes[:] = closest[1] + [code for code in codes if code not in table]
+        rest = codes[12:]
+        self.rng.shuffle(rest)
+        codes[12:] = rest
+        return in_band
+
+    def shuffle(self, sets=None):
+        codes = [*self._deck[self._head:], *self._found, *(card.code for card in self.on_table)]
         self.on_table.clear()
-        self.found_sets.clear()
-        random.shuffle(self.deck)
-        self.on_table.extend(self.deck[:12])
-        del self.deck[:12]
-        while find_set(self.on_table) is None:
-            self.on_table.extend(self.deck[:3])
-            del self.deck[:3]
+        self._found.clear()
+        self._index_reset()
+        if sets is None:
+            self.rng.shuffle(codes)
+            self.off_band = False
+        else:
+            self.off_band = not self._order_with_sets(codes, *sets)
+        self._deck = bytearray(codes)
+        self._head = 0
+        self._deal(12)
+        while not self.has_set():
+            self._deal(3)
 
     def check_set(self, i, j, k):
         return check_set(self.on_table[i], self.on_table[j], self.on_table[k])
 
+    def has_set(self):
+        return len(self._sets) != 0
+
+    def count_sets(self):
+        return len(self._sets)
+
+    def all_sets(self):
+        return [sorted((self._positions[code] for code in triple), reverse=True) for triple in self._sets]
+
     def find_set(self):
-        return find_set(self.on_table)
+        # Same pick as the module-level find_set: lowest highest index, then lowest middle one
+        return min(self.all_sets(), default=None)
 
     def take_set(self, i, j, k):
         for idx in (i, j, k):
-            self.found_sets.append(self.on_table[idx])
-        without = [self.on_table[o] for o in range(len(self.on_table)) if o not in (i, j, k)]
-        if len(self.on_table) >= 15 and find_set(without) is not None or len(self.deck) == 0:
+            self._found.append(self.on_table[idx].code)
+            self._index_remove(self.on_table[idx])
+        if len(self.on_table) >= 15 and self.has_set() or self.deck_size() == 0:
             for idx in (i, j, k):
                 self.on_table[idx] = None
             self.on_table[:] = [card for card in self.on_table if card is not None]
+            for idx, card in enumerate(self.on_table):
+                self._positions[card.code] = idx
             return
-        self.on_table[i], self.on_table[j], self.on_table[k] = self.deck[:3]
-        del self.deck[:3]
-        while len(self.deck) != 0 and self.find_set() is None:
-            self.on_table.extend(self.deck[:3])
-            del self.deck[:3]
+        for idx, code in zip((i, j, k), self._deck[self._head:self._head + 3]):
+            self.on_table[idx] = CARDS[code]
+            self._index_add(CARDS[code], idx)
+        self._head += 3
+        while self.deck_size() != 0 and not self.has_set():
+            self._deal(3)
 
     def flip_found(self):
-        random.shuffle(self.found_sets)
-        self.deck.extend(self.found_sets)
-        del self.found_sets[:]
-        while len(self.deck) != 0 and self.find_set() is None:
-            self.on_table.extend(self.deck[:3])
-            del self.deck[:3]
+        found = list(self._found)
+        self.rng.shuffle(found)
+        self._deck = self._deck[self._head:] + bytes(found)
+        self._head = 0
+        self._found.clear()
+        while self.deck_size() != 0 and not self.has_set():
+            self._deal(3)
 
     def __len__(self):
         return len(self.on_table)
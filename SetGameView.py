@@ -1,8 +1,14 @@
+import time
+
 import cairo
 import gi
 
-from SetCard import CARD_ASPECT_RATIO, pi
+from SetCard import CARD_ASPECT_RATIO, CardRenderCache
+from SetEventLog import NO_SLOT, Event
+from SetFieldCanvas import FRAME_MARGIN, FieldGeometry, cell_slot, frame_border, paint_field, slot_position
 from SetGameField import GameField
+from SetMetrics import METRICS
+from SetScheduler import FrameScheduler
 
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk, Gdk
@@ -19,109 +25,291 @@ class FieldLayout:
 
 
 class GameView:
-    def __init__(self, field: GameField, frame: Gtk.AspectFrame, layout: FieldLayout, set_found_callback):
+    def __init__(self, field: GameField, frame: Gtk.AspectFrame, layout: FieldLayout, set_found_callback,
+                 event_callback=None, scheduler: FrameScheduler = None):
         self.field = field
         self.frame = frame
         self.layout = layout
         self.set_found_callback = set_found_callback
+        self.event_callback = event_callback
+        self.scheduler = scheduler
         self.painter = [FRAME_DEFAULT_RGB for _ in range(len(field))]
         self.selected = set()
         self.active = True
+        self.render_cache = CardRenderCache()
+        self.grid_size = None
+        self.canvases = []
+        self.slot_cards = []
+        self.dirty_slots = set()
+        self.dirty_frames = set()
+        self.ratio = None
+        self.attached_layout = None
+        self.resize_handler = frame.get_children()[0].connect("size-allocate", self.on_grid_resized)
         self.make_canvases_for_cards()
 
+    def on_grid_resized(self, _widget, allocation):
+        if self.grid_size != (allocation.width, allocation.height):
+            self.grid_size = (allocation.width, allocation.height)
+            self.render_cache.invalidate()
+
     def set_active(self, active):
         self.active = active
-        self.painter = [FRAME_DEFAULT_RGB for _ in range(len(self.field))]
+        self.reset_frames()
         if not self.active:
             self.make_canvases_for_cards()
 
     def set_layout(self, layout):
         self.layout = layout
+        self.render_cache.invalidate()
         self.make_canvases_for_cards()
 
+    def select_cell(self, left, top):
+        # Keyboard selection by grid cell, in the same coordinates as slot_position
+        i = cell_slot(left, top, self.layout.field_vertical)
+        if self.active and i < len(self.field):
+            self.process_card_clicked(i)
+
     def process_card_clicked(self, i):
+        t = time.monotonic_ns()
         if i >= len(self.field):
             return
         if i in self.selected:
             self.selected.remove(i)
         else:
             self.selected.add(i)
-        self.painter[i] = FRAME_SELECTED_RGB if i in self.selected else FRAME_DEFAULT_RGB
+        if self.event_callback is not None:
+            self.event_callback(Event.SELECT if i in self.selected else Event.DESELECT, [self.field[i]], i, t)
+        self.set_frame(i, FRAME_SELECTED_RGB if i in self.selected else FRAME_DEFAULT_RGB)
         if len(self.selected) == 3 and self.field.check_set(*self.selected):
             self.set_found_callback(*self.selected)
             self.selected = set()
-            self.painter = [FRAME_DEFAULT_RGB for _ in range(len(self.field))]
+            self.reset_frames()
             self.make_canvases_for_cards()
-        self.redraw()
+        elif len(self.selected) == 3 and i in self.selected and self.event_callback is not None:
+            self.event_callback(Event.MISS, [self.field[idx] for idx in self.selected], NO_SLOT, t)
+        self.request_redraw()
+
+    def set_frame(self, i, rgb):
+        if self.painter[i] != rgb:
+            self.painter[i] = rgb
+            self.dirty_frames.add(i)
+
+    def reset_frames(self):
+        for i, rgb in enumerate(self.painter):
+            if rgb != FRAME_DEFAULT_RGB and i < len(self.field):
+                self.dirty_frames.add(i)
+        self.painter = [FRAME_DEFAULT_RGB for _ in range(len(self.field))]
 
     def make_canvases_for_cards(self):
+        start = time.perf_counter_ns()
+        c, r = self.set_ratio()
+        gr = self.frame.get_children()[0]
+        if self.attached_layout != (self.layout.field_vertical, self.layout.card_vertical):
+            self.attached_layout = (self.layout.field_vertical, self.layout.card_vertical)
+            for i, canvas in enumerate(self.canvases):
+                left, top = self.slot_position(i)
+                gr.child_set_property(canvas, "left-attach", left)
+                gr.child_set_property(canvas, "top-attach", top)
+            self.slot_cards = [None] * len(self.canvases)
+        while len(self.canvases) > c * r:
+            gr.remove(self.canvases.pop())
+            self.slot_cards.pop()
+        while len(self.canvases) < c * r:
+            canvas = self.make_canvas(len(self.canvases))
+            gr.attach(canvas, *self.slot_position(len(self.canvases)), 1, 1)
+            self.canvases.append(canvas)
+            self.slot_cards.append(None)
+
+        for i, canvas in enumerate(self.canvases):
+            card = self.field[i].code if self.active else None
+            if card != self.slot_cards[i]:
+                self.slot_cards[i] = card
+                self.dirty_slots.add(i)
+        self.request_redraw()
+        METRICS.record("view.rebuild", time.perf_counter_ns() - start)
+
+    def set_ratio(self):
         if self.active:
             c, r = self.field.size()
         else:
             c, r = 3, 4
         ratio = ((c / r) if self.layout.field_vertical else (r / c)) * \
                 (CARD_ASPECT_RATIO if not self.layout.card_vertical else 1 / CARD_ASPECT_RATIO)
-        self.frame.set_property("ratio", ratio)
+        if ratio != self.ratio:
+            self.frame.set_property("ratio", ratio)
+            self.ratio = ratio
+        return c, r
+
+    def slot_position(self, i):
+        return slot_position(i, self.layout.field_vertical)
+
+    def detach(self):
+        # Leaves the grid empty for another view of the same field
         gr = self.frame.get_children()[0]
-        for child in gr.get_children():
-            gr.remove(child)
+        gr.disconnect(self.resize_handler)
+        for canvas in self.canvases:
+            gr.remove(canvas)
+        self.canvases.clear()
 
-        for i in range(c * r):
-            x = i % 3
-            y = (i - x) // 3
-            canvas = Gtk.DrawingArea()
-
-            def draw_handler(i):
-                def on_draw(_w, ctx: cairo.Context):
-                    w = _w.get_allocated_width()
-                    h = _w.get_allocated_height()
-                    wd, hd = (330, 120) if not self.layout.card_vertical else (120, 330)
-                    ctx.scale(w / wd, h / hd)
-                    if self.active:
-                        self.field[i].draw(ctx, lw=w / 200 * 2, rotate=self.layout.card_vertical)
-                    ctx.scale(wd / w, hd / h)
-
-                    m = 0.015 * w
-                    ctx.rectangle(m, m, w - 2 * m, h - 2 * m)
-                    if self.active:
-                        ctx.set_source_rgb(*self.painter[i])
-                    else:
-                        ctx.set_source_rgb(*FRAME_DEFAULT_RGB)
-                    ctx.set_line_width(m)
-                    ctx.stroke()
-
-                return on_draw
-
-            canvas.connect("draw", draw_handler(i))
-
-            def click_handler(i):
-                def on_click(widget, event: Gdk.EventButton):
-                    if not self.active:
-                        return
-                    if event.button == Gdk.BUTTON_PRIMARY and event.type == Gdk.EventType.BUTTON_PRESS:
-                        self.process_card_clicked(i)
-
-                return on_click
+    def make_canvas(self, i):
+        canvas = Gtk.DrawingArea()
+
+        def on_draw(_w, ctx: cairo.Context):
+            start = time.perf_counter_ns()
+            w = _w.get_allocated_width()
+            h = _w.get_allocated_height()
+            if self.active:
+                ctx.set_source_surface(self.render_cache.get(self.field[i], w, h, self.layout.card_vertical,
+                                                             lw=w / 200 * 2, scale=_w.get_scale_factor()), 0, 0)
+                ctx.paint()
 
+            m = FRAME_MARGIN * w
+            ctx.rectangle(m, m, w - 2 * m, h - 2 * m)
             if self.active:
-                canvas.connect("button-press-event", click_handler(i))
-            canvas.show()
-            # canvas.activate()
-            canvas.set_events(canvas.get_events() | Gdk.EventMask.BUTTON_PRESS_MASK | Gdk.EventMask.TOUCH_MASK)
-            if self.layout.field_vertical:
-                gr.attach(canvas, x, y, 1, 1)
+                ctx.set_source_rgb(*self.painter[i])
             else:
-                gr.attach(canvas, y, x, 1, 1)
+                ctx.set_source_rgb(*FRAME_DEFAULT_RGB)
+            ctx.set_line_width(m)
+            ctx.stroke()
+            METRICS.record("view.draw", time.perf_counter_ns() - start)
+
+        def on_click(_widget, event: Gdk.EventButton):
+            if not self.active:
+                return
+            if event.button == Gdk.BUTTON_PRIMARY and event.type == Gdk.EventType.BUTTON_PRESS:
+                self.process_card_clicked(i)
+
+        canvas.connect("draw", on_draw)
+        canvas.connect("button-press-event", on_click)
+        canvas.set_events(canvas.get_events() | Gdk.EventMask.BUTTON_PRESS_MASK | Gdk.EventMask.TOUCH_MASK)
+        canvas.show()
+        return canvas
 
     def redraw(self):
-        for c in self.frame.get_children()[0].get_children():
-            c.queue_draw()
+        self.dirty_slots.update(range(len(self.canvases)))
+        self.request_redraw()
+
+    def request_redraw(self):
+        # With a scheduler, all changes until the next frame are flushed in one pass
+        if self.scheduler is None:
+            self.flush_redraw()
+        else:
+            self.scheduler.request("view", self.flush_redraw)
 
-    def hint_set(self):
+    def flush_redraw(self):
+        for i in self.dirty_slots:
+            if i < len(self.canvases):
+                self.canvases[i].queue_draw()
+        for i in self.dirty_frames - self.dirty_slots:
+            if i < len(self.canvases):
+                canvas = self.canvases[i]
+                w = canvas.get_allocated_width()
+                h = canvas.get_allocated_height()
+                b = frame_border(w)
+                canvas.queue_draw_area(0, 0, w, b)
+                canvas.queue_draw_area(0, h - b, w, b)
+                canvas.queue_draw_area(0, 0, b, h)
+                canvas.queue_draw_area(w - b, 0, b, h)
+        self.dirty_slots.clear()
+        self.dirty_frames.clear()
+
+    def clear_hint(self):
+        for i, rgb in enumerate(self.painter):
+            if rgb == FRAME_HINT_RGB:
+                self.set_frame(i, FRAME_DEFAULT_RGB)
+        self.request_redraw()
+
+    def hint_set(self, s=None):
         if not self.active:
             return
-        for idx in self.field.find_set():
-            self.painter[idx] = FRAME_HINT_RGB
+        for idx in self.field.find_set() if s is None else s:
+            self.set_frame(idx, FRAME_HINT_RGB)
             if idx in self.selected:
                 self.selected.remove(idx)
-        self.redraw()
+        self.request_redraw()
+
+
+class CanvasGameView(GameView):
+    # Draws the whole field on a single DrawingArea and finds the clicked card from the slot geometry
+    def __init__(self, *args, **kw):
+        self.canvas = None
+        super().__init__(*args, **kw)
+
+    def make_canvases_for_cards(self):
+        start = time.perf_counter_ns()
+        c, r = self.set_ratio()
+        if self.canvas is None:
+            self.canvas = self.make_field_canvas()
+            self.frame.get_children()[0].attach(self.canvas, 0, 0, 1, 1)
+        layout = (self.layout.field_vertical, self.layout.card_vertical)
+        if self.attached_layout != layout or len(self.slot_cards) != c * r:
+            self.attached_layout = layout
+            self.slot_cards = [None] * (c * r)
+            self.canvas.queue_draw()
+        for i in range(c * r):
+            card = self.field[i].code if self.active else None
+            if card != self.slot_cards[i]:
+                self.slot_cards[i] = card
+                self.dirty_slots.add(i)
+        self.request_redraw()
+        METRICS.record("view.rebuild", time.perf_counter_ns() - start)
+
+    def geometry(self):
+        return FieldGeometry(len(self.slot_cards), self.layout.field_vertical, self.canvas.get_allocated_width(),
+                             self.canvas.get_allocated_height())
+
+    def make_field_canvas(self):
+        canvas = Gtk.DrawingArea(hexpand=True, vexpand=True)
+
+        def on_draw(_w, ctx: cairo.Context):
+            start = time.perf_counter_ns()
+            slots = len(self.slot_cards)
+            if self.active:
+                cards = [self.field[i] for i in range(slots)]
+                frames = [self.painter[i] if i < len(self.painter) else FRAME_DEFAULT_RGB for i in range(slots)]
+            else:
+                cards = [None] * slots
+                frames = [FRAME_DEFAULT_RGB] * slots
+            paint_field(ctx, self.geometry(), cards, frames, self.render_cache, self.layout.card_vertical,
+                        ctx.clip_extents(), _w.get_scale_factor())
+            METRICS.record("view.draw", time.perf_counter_ns() - start)
+
+        def on_click(_widget, event: Gdk.EventButton):
+            if not self.active:
+                return
+            if event.button == Gdk.BUTTON_PRIMARY and event.type == Gdk.EventType.BUTTON_PRESS:
+                i = self.geometry().slot_at(event.x, event.y)
+                if i is not None and i < len(self.field):
+                    self.process_card_clicked(i)
+
+        canvas.connect("draw", on_draw)
+        canvas.connect("button-press-event", on_click)
+        canvas.set_events(canvas.get_events() | Gdk.EventMask.BUTTON_PRESS_MASK | Gdk.EventMask.TOUCH_MASK)
+        canvas.show()
+        return canvas
+
+    def flush_redraw(self):
+        if self.canvas is not None:
+            geometry = self.geometry()
+            for i in self.dirty_slots:
+                if i < geometry.slots:
+                    self.canvas.queue_draw_area(*geometry.slot_rect(i))
+            for i in self.dirty_frames - self.dirty_slots:
+                if i < geometry.slots:
+                    for rect in geometry.frame_rects(i):
+                        self.canvas.queue_draw_area(*rect)
+        self.dirty_slots.clear()
+        self.dirty_frames.clear()
+
+    def redraw(self):
+        self.dirty_slots.clear()
+        self.dirty_frames.clear()
+        if self.canvas is not None:
+            self.canvas.queue_draw()
+
+    def detach(self):
+        gr = self.frame.get_children()[0]
+        gr.disconnect(self.resize_handler)
+        if self.canvas is not None:
+            gr.remove(self.canvas)
+            self.canvas = None
@@ -0,0 +1,234 @@
+import argparse
+import json
+import random
+import sys
+import time
+from collections import defaultdict
+
+import gi
+
+gi.require_version('Gtk', '3.0')
+from gi.repository import Gdk, GLib, Gtk
+
+from SetBenchmark import compare, percentile
+from SetEngine import CARD_COUNT, check_set_codes, find_set_codes
+from SetGame import RENDERERS, Game, Settings
+from SetGameController import GameLim
+from SetGameView import FieldLayout
+from SetScheduler import FrameScheduler
+
+DEFAULT_MIX = "set=6,miss=2,hint=1,layout=1,redraw=1"
+FRAME_TIMEOUT_MS = 1000
+
+
+def large_table_snapshot(rng, size):
+    while True:
+        codes = rng.sample(range(CARD_COUNT), CARD_COUNT)
+        if find_set_codes(codes[:size]) is not None:
+            return bytes((size, CARD_COUNT - size, 0, *codes))
+
+
+class LatencyHarness:
+    def __init__(self, table_size=None, width=600, height=400, onscreen=False, seed=0, renderer="grid"):
+        self.rng = random.Random(seed)
+        self.table_size = table_size
+        self.win = Gtk.Window(title="Set game") if onscreen else Gtk.OffscreenWindow()
+        field_grid = Gtk.Grid(row_spacing=15, column_spacing=15)
+        field_grid.set_column_homogeneous(True)
+        field_grid.set_row_homogeneous(True)
+        field_grid.set_size_request(width, height)
+        asp = Gtk.AspectFrame(obey_child=False)
+        asp.add(field_grid)
+        self.win.add(asp)
+        settings = Settings(None, mode=GameLim.INFINITE.value, stats=False, events=False, renderer=renderer)
+        self.layout = settings.field_layout
+        self.game = Game(asp, settings, scheduler=FrameScheduler(self.win))
+        self.field = self.game.controller.field
+        self.field.rng = self.rng
+        self.samples = defaultdict(list)
+        self.missed = defaultdict(int)
+        self.painted = False
+        self.paint_ns = self.draw_start = 0
+        self.draw_ns = 0
+        self.win.connect("draw", self.on_draw_start)
+        self.win.connect_after("draw", self.on_draw_end)
+        self.win.show_all()
+        self.win.get_frame_clock().connect("after-paint", self.on_after_paint)
+        self.game.restart()
+        self.wait_frame()
+        self.inflate()
+
+    def on_draw_start(self, _w, _ctx):
+        self.draw_start = time.perf_counter_ns()
+        return False
+
+    def on_draw_end(self, _w, _ctx):
+        self.draw_ns += time.perf_counter_ns() - self.draw_start
+        return False
+
+    def on_after_paint(self, _clock):
+        self.paint_ns = time.perf_counter_ns()
+        self.painted = True
+
+    def wait_frame(self):
+        timed_out = False
+
+        def on_timeout():
+            nonlocal timed_out
+            timed_out = True
+            return False
+
+        source = GLib.timeout_add(FRAME_TIMEOUT_MS, on_timeout)
+        while not self.painted and not timed_out:
+            Gtk.main_iteration_do(True)
+        if not timed_out:
+            GLib.source_remove(source)
+        return self.painted
+
+    def measure(self, kind, action, *args):
+        self.painted = False
+        self.draw_ns = 0
+        start = time.perf_counter_ns()
+        action(*args)
+        handled = time.perf_counter_ns()
+        if self.wait_frame():
+            self.samples[kind].append((self.paint_ns - start, handled - start, self.draw_ns))
+        else:
+            self.missed[kind] += 1
+
+    def inflate(self):
+        # Deals a fresh table of the requested size outside of the measurements
+        if self.table_size is not None and len(self.field) < self.table_size:
+            self.field.restore(large_table_snapshot(self.rng, self.table_size))
+            self.game.view.selected.clear()
+            self.game.view.reset_frames()
+            self.game.view.make_canvases_for_cards()
+            self.painted = False
+            self.wait_frame()
+
+    def click(self, kind, i):
+        self.measure(kind, self.game.view.process_card_clicked, i)
+
+    def clear_selection(self):
+        for i in sorted(self.game.view.selected):
+            self.click("deselect", i)
+
+    def play_set(self):
+        picks = list(self.field.find_set())
+        self.rng.shuffle(picks)
+        for i in picks[:2]:
+            self.click("select", i)
+        self.click("set", picks[2])
+        self.inflate()
+
+    def play_miss(self):
+        codes = [card.code for card in self.field.on_table]
+        while True:
+            picks = self.rng.sample(range(len(codes)), 3)
+            if not check_set_codes(*(codes[i] for i in picks)):
+                break
+        for i in picks[:2]:
+            self.click("select", i)
+        self.click("miss", picks[2])
+        self.clear_selection()
+
+    def play_hint(self):
+        self.measure("hint", self.game.show_hint)
+
+    def play_redraw(self):
+        # Invalidates every card at once, as when the window is exposed or the theme changes
+        self.measure("redraw", self.game.view.redraw)
+
+    def play_layout(self):
+        current = (self.layout.field_vertical, self.layout.card_vertical)
+        choices = [(f, c) for f in (False, True) for c in (False, True) if (f, c) != current]
+        self.layout = FieldLayout(*self.rng.choice(choices))
+        self.measure("layout", self.game.view.set_layout, self.layout)
+
+    def run(self, actions, mix):
+        plays = {"set": self.play_set, "miss": self.play_miss, "hint": self.play_hint, "layout": self.play_layout,
+                 "redraw": self.play_redraw}
+        kinds = list(mix)
+        weights = [mix[kind] for kind in kinds]
+        for _ in range(actions):
+            self.clear_selection()
+            plays[self.rng.choices(kinds, weights)[0]]()
+
+    def close(self):
+        self.game.close()
+        self.win.destroy()
+
+    def results(self):
+        results = {}
+        for kind, samples in sorted(self.samples.items()):
+            latency, handler, draw = (list(column) for column in zip(*samples))
+            results[kind] = {
+                "unit": "ns",
+                "number": len(samples),
+                "missed_frames": self.missed[kind],
+                "p50": percentile(latency, 50),
+                "p90": percentile(latency, 90),
+                "p99": percentile(latency, 99),
+                "max": max(latency),
+                "handler_p50": percentile(handler, 50),
+                "draw_p50": percentile(draw, 50),
+            }
+        return results
+
+
+def parse_mix(mix):
+    pairs = (item.split("=") for item in mix.split(","))
+    return {kind: float(weight) for kind, weight in pairs}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure click-to-frame latency of GameView in a headless Gtk window")
+    parser.add_argument("--actions", type=int, default=500)
+    parser.add_argument("--table-size", type=int, nargs="+", choices=[12, 15, 18, 21],
+                        help="keep the table at this size, one run per size")
+    parser.add_argument("--mix", default=DEFAULT_MIX,
+                        help="relative weights of set, miss, hint, layout and redraw actions")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--width", type=int, default=600)
+    parser.add_argument("--height", type=int, default=400)
+    parser.add_argument("--renderer", nargs="+", choices=list(RENDERERS), default=["grid"],
+                        help="field renderers to measure; with several, later ones are compared to the first")
+    parser.add_argument("--onscreen", action="store_true", help="use a regular toplevel instead of an offscreen window")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed relative slowdown")
+    args = parser.parse_args()
+    if Gdk.Display.get_default() is None:
+        sys.exit("No display available, run under xvfb-run or with GDK_BACKEND=broadway")
+    sizes = args.table_size or [None]
+    runs = {}
+    for size in sizes:
+        for renderer in args.renderer:
+            harness = LatencyHarness(size, args.width, args.height, args.onscreen, args.seed, renderer)
+            harness.run(args.actions, parse_mix(args.mix))
+            runs[renderer, size] = harness.results()
+            harness.close()
+            print(f"{renderer}, table size {size or 'any'}:")
+            for kind, res in runs[renderer, size].items():
+                print(f"  {kind:10} n={res['number']:5}  p50 {res['p50'] / 1e6:8.2f}  p90 {res['p90'] / 1e6:8.2f}  "
+                      f"p99 {res['p99'] / 1e6:8.2f}  max {res['max'] / 1e6:8.2f} ms  "
+                      f"(handler {res['handler_p50'] / 1e6:.2f}, draw {res['draw_p50'] / 1e6:.2f} ms)")
+        for renderer in args.renderer[1:]:
+            print(f"{args.renderer[0]} -> {renderer}, table size {size or 'any'}, p99:")
+            compare(runs[renderer, size], runs[args.renderer[0], size], args.threshold, "p99")
+    if len(runs) == 1:
+        results = next(iter(runs.values()))
+    else:
+        # Flat names so that the file still works as a --baseline
+        results = {f"{renderer}/{size or 'any'}/{kind}": res for (renderer, size), kinds in runs.items()
+                   for kind, res in kinds.items()}
+    if args.output:
+        json.dump(results, open(args.output, "w"), indent=2)
+    if args.baseline:
+        regressions = compare(results, json.load(open(args.baseline)), args.threshold, "p99")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import json
+import time
+from array import array
+from threading import Lock
+
+METRICS_SIZE = 1024
+# Main loop lateness above this counts as a stall
+STALL_NS = 100 * 10 ** 6
+OVERLAY_NAMES = {"view.draw": "draw", "view.rebuild": "rebuild", "field.take_set": "take", "field.find_set": "find",
+                 "field.solve": "solve", "stats.record": "stats", "loop.lag": "lag"}
+
+
+class Metric:
+    def __init__(self, size):
+        # Ring buffer of the latest durations in nanoseconds
+        self.samples = array("q", [0]) * size
+        self.count = 0
+
+    def add(self, ns):
+        self.samples[self.count % len(self.samples)] = ns
+        self.count += 1
+
+    def summary(self):
+        values = sorted(self.samples[:min(self.count, len(self.samples))])
+        if not values:
+            return None
+        n = len(values) - 1
+        return {"count": self.count, "p50": values[n // 2], "p90": values[n * 9 // 10], "p99": values[n * 99 // 100],
+                "max": values[-1]}
+
+
+class Metrics:
+    def __init__(self, size=METRICS_SIZE):
+        self.enabled = False
+        self.size = size
+        # The stats worker records from its own thread, so new names are added and read under the lock
+        self.metrics = {}
+        self.lock = Lock()
+        self.stalls = 0
+
+    def record(self, name, ns):
+        if self.enabled:
+            metric = self.metrics.get(name)
+            if metric is None:
+                with self.lock:
+                    metric = self.metrics.setdefault(name, Metric(self.size))
+            metric.add(ns)
+
+    def heartbeat(self, due_ns):
+        # Called from a main loop timer that was due at perf_counter_ns() == due_ns; lateness means the loop
+        # was busy elsewhere
+        if self.enabled:
+            lag = max(time.perf_counter_ns() - due_ns, 0)
+            self.record("loop.lag", lag)
+            self.stalls += lag > STALL_NS
+
+    def summary(self):
+        with self.lock:
+            metrics = sorted(self.metrics.items())
+        return {name: metric.summary() for name, metric in metrics}
+
+    def overlay_text(self):
+        parts = []
+        for name, short in OVERLAY_NAMES.items():
+            metric = self.metrics.get(name)
+            s = metric.summary() if metric is not None else None
+            if s is not None:
+                parts.append(f"{short} {s['p50'] / 1e6:.2f}/{s['p99'] / 1e6:.2f}")
+        parts.append(f"stalls {self.stalls}")
+        return "p50/p99 ms: " + "  ".join(parts)
+
+    def dump(self, path):
+        with open(path, "a") as f:
+            f.write(json.dumps({"time": time.time(), "stalls": self.stalls, "metrics": self.summary()}) + "\n")
+
+
+METRICS = Metrics()
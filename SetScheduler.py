@@ -0,0 +1,60 @@
+import time
+
+from gi.repository import GLib
+
+from SetMetrics import METRICS
+
+
+class FrameScheduler:
+    # Runs requested work once per frame from the frame clock of widget. Requests made with the same key before
+    # the frame are coalesced, and nothing is woken up while there are no requests and no timer.
+    def __init__(self, widget):
+        self.widget = widget
+        self.pending = {}
+        self.frame_hooks = []
+        self.tick_id = None
+        self.timer_id = None
+        self.timer_due = None
+
+    def request(self, key, callback):
+        self.pending[key] = callback
+        self.wake()
+
+    def wake(self):
+        # A frame for the frame hooks alone
+        if self.tick_id is None:
+            self.tick_id = self.widget.add_tick_callback(self._on_tick)
+
+    def add_frame_hook(self, callback):
+        # Runs after the requests of every frame the scheduler wakes up for
+        self.frame_hooks.append(callback)
+
+    def request_after(self, delay_ns, key, callback):
+        # A single timer wakeup that turns into a frame request; replaces the timer set before
+        self.cancel_timer()
+        delay_ms = -(-delay_ns // 10 ** 6)
+        self.timer_due = time.perf_counter_ns() + delay_ms * 10 ** 6
+        self.timer_id = GLib.timeout_add(delay_ms, self._on_timer, key, callback)
+
+    def timer_pending(self):
+        return self.timer_id is not None
+
+    def cancel_timer(self):
+        if self.timer_id is not None:
+            GLib.source_remove(self.timer_id)
+            self.timer_id = None
+
+    def _on_timer(self, key, callback):
+        self.timer_id = None
+        METRICS.heartbeat(self.timer_due)
+        self.request(key, callback)
+        return GLib.SOURCE_REMOVE
+
+    def _on_tick(self, _widget, _clock):
+        self.tick_id = None
+        pending, self.pending = self.pending, {}
+        for callback in pending.values():
+            callback()
+        for callback in self.frame_hooks:
+            callback()
+        return GLib.SOURCE_REMOVE
@@ -0,0 +1,290 @@
+import argparse
+import asyncio
+import json
+import random
+import resource
+import statistics
+import time
+from collections import Counter
+from itertools import count
+
+from SetEngine import find_set_codes
+from SetEventLog import Event
+from SetGameController import MAX_TARGET_SETS, Difficulty, GameController, GameLim, GameMode
+from SetGameField import GameField
+
+# One JSON object per line in both directions. Requests carry an "op" and an optional "id" that is echoed back;
+# cards are identified by their codes (SetEngine.encode). Messages with an "event" key are pushed to the other
+# players of a shared room when its table changes.
+DEFAULT_TCP = "127.0.0.1:7341"
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class Session:
+    ids = count(1)
+
+    def __init__(self, writer):
+        self.name = f"player{next(Session.ids)}"
+        self.writer = writer
+        self.room = None
+
+    def send(self, message):
+        self.writer.write(json.dumps(message, separators=(",", ":")).encode() + b"\n")
+
+
+class Room:
+    def __init__(self, name, mode: GameMode, seed=None):
+        self.name = name
+        self.field = GameField(random.Random(seed))
+        self.controller = GameController(self.field, mode, collect_stats=False)
+        self.players = {}
+        self.taken_by = {}
+        self.version = 0
+        self.restart()
+
+    def state(self):
+        return {"room": self.name, "version": self.version, "table": [card.code for card in self.field.on_table],
+                "deck": self.field.deck_size(), "found": self.controller.counter,
+                "over": not self.controller.is_game_played(),
+                "scores": {session.name: score for session, score in self.players.items()}}
+
+    def changed(self, by: Session, reason):
+        self.version += 1
+        event = {"event": reason, "by": by.name, **self.state()}
+        for session in self.players:
+            if session is not by:
+                session.send(event)
+
+    def restart(self):
+        self.controller.restart()
+        self.taken_by.clear()
+        for session in self.players:
+            self.players[session] = 0
+
+    def claim(self, session: Session, cards):
+        # Claims are applied in the order they reach the server. A claim made against an older table still
+        # succeeds if all of its cards are on the table, so only overlapping claims can lose.
+        codes = [int(code) for code in cards]
+        if len(set(codes)) != 3:
+            raise ProtocolError("a claim needs three different cards")
+        if not self.controller.is_game_played():
+            return {"claimed": False, "reason": "game over"}
+        slots = {card.code: idx for idx, card in enumerate(self.field.on_table)}
+        gone = [code for code in codes if code not in slots]
+        if gone:
+            return {"claimed": False, "reason": "taken", "by": sorted({self.taken_by.get(code) for code in gone},
+                                                                    key=str)}
+        picks = [slots[code] for code in codes]
+        if not self.field.check_set(*picks):
+            self.controller.log_event(Event.MISS, [self.field[idx] for idx in picks])
+            return {"claimed": False, "reason": "not a set"}
+        self.controller.take_set(*picks)
+        for code in codes:
+            self.taken_by[code] = session.name
+        self.players[session] += 1
+        self.changed(session, "claimed")
+        return {"claimed": True}
+
+
+class GameServer:
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+        self.rooms = {}
+        self.ops = {"join": self.join, "state": self.state, "claim": self.claim, "hint": self.hint,
+                    "flip": self.flip, "restart": self.restart, "leave": self.leave}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        session = Session(writer)
+        try:
+            async for line in reader:
+                request = {}
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ProtocolError("requests must be JSON objects")
+                    op = self.ops.get(request.get("op"))
+                    if op is None:
+                        raise ProtocolError(f"unknown op {request.get('op')!r}")
+                    reply = {"ok": True, **op(session, request)}
+                except (ProtocolError, KeyError, ValueError, TypeError) as e:
+                    reply = {"ok": False, "error": str(e)}
+                if "id" in request:
+                    reply["id"] = request["id"]
+                session.send(reply)
+                await writer.drain()
+        except (ValueError, asyncio.LimitOverrunError):
+            # A line over the reader limit can't be skipped reliably, so the session ends after the reply
+            session.send({"ok": False, "error": "request line too long"})
+        except ConnectionError:
+            pass
+        finally:
+            self.leave(session, {})
+            writer.close()
+
+    def room_of(self, session: Session):
+        if session.room is None:
+            raise ProtocolError("join a room first")
+        return session.room
+
+    def join(self, session: Session, request):
+        self.leave(session, request)
+        session.name = str(request.get("name", session.name))
+        name = request.get("room")
+        if name is None:
+            # A private game that nobody else can join
+            name = f"~{session.name}#{id(session)}"
+        room = self.rooms.get(name)
+        if room is None:
+            sets = request.get("sets")
+            mode = GameMode(GameLim(request.get("mode", GameLim.INFINITE.value)), bool(request.get("shuffle", False)),
+                            Difficulty(request.get("difficulty", Difficulty.ANY.value)),
+                            min(max(int(sets), 1), MAX_TARGET_SETS) if sets else None)
+            if mode.limit == GameLim.FIND_ALL:
+                mode.shuffle = False
+            room = self.rooms[name] = Room(name, mode, self.rng.getrandbits(64))
+        room.players[session] = 0
+        session.room = room
+        return room.state()
+
+    def leave(self, session: Session, _request):
+        room = session.room
+        if room is not None:
+            del room.players[session]
+            session.room = None
+            if not room.players:
+                del self.rooms[room.name]
+        return {}
+
+    def state(self, session: Session, _request):
+        return self.room_of(session).state()
+
+    def claim(self, session: Session, request):
+        room = self.room_of(session)
+        return {**room.claim(session, request["cards"]), **room.state()}
+
+    def hint(self, session: Session, _request):
+        room = self.room_of(session)
+        s = room.field.find_set()
+        room.controller.mark_hint()
+        return {"cards": [room.field[idx].code for idx in s] if s is not None else None}
+
+    def flip(self, session: Session, _request):
+        room = self.room_of(session)
+        if room.field.has_set():
+            raise ProtocolError("there is a set on the table")
+        room.controller.flip_found()
+        room.changed(session, "flipped")
+        return room.state()
+
+    def restart(self, session: Session, _request):
+        room = self.room_of(session)
+        room.restart()
+        room.changed(session, "restarted")
+        return room.state()
+
+
+async def start_server(server: GameServer, tcp=None, unix=None):
+    if unix is not None:
+        return await asyncio.start_unix_server(server.handle, unix, limit=1 << 16, backlog=4096)
+    host, port = (tcp or DEFAULT_TCP).rsplit(":", 1)
+    return await asyncio.start_server(server.handle, host, int(port), limit=1 << 16, backlog=4096)
+
+
+async def open_client(tcp=None, unix=None):
+    if unix is not None:
+        return await asyncio.open_unix_connection(unix)
+    host, port = (tcp or DEFAULT_TCP).rsplit(":", 1)
+    return await asyncio.open_connection(host, int(port))
+
+
+class LoadClient:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.ids = count()
+        self.table = []
+
+    async def call(self, op, **request):
+        request_id = next(self.ids)
+        self.writer.write(json.dumps({"op": op, "id": request_id, **request}).encode() + b"\n")
+        while True:
+            message = json.loads(await self.reader.readline())
+            if "table" in message:
+                self.table = message["table"]
+            if message.get("id") == request_id:
+                return message
+
+
+async def load_session(address, room, claims, think, rng, latencies, outcomes):
+    client = LoadClient(*await open_client(**address))
+    await client.call("join", room=room)
+    for _ in range(claims):
+        if think:
+            await asyncio.sleep(rng.expovariate(1 / think))
+        s = find_set_codes(client.table)
+        if s is None:
+            await client.call("flip")
+            continue
+        start = time.perf_counter_ns()
+        reply = await client.call("claim", cards=[client.table[idx] for idx in s])
+        latencies.append(time.perf_counter_ns() - start)
+        outcomes[reply.get("reason", "claimed")] += 1
+    await client.call("leave")
+    client.writer.close()
+
+
+async def run_load(sessions, claims, room_size, think, address, external):
+    server = None
+    if not external:
+        server = await start_server(GameServer(0), **address)
+    latencies, outcomes = [], Counter()
+    start = time.perf_counter()
+    await asyncio.gather(*(load_session(address, f"room{n // room_size}" if room_size > 1 else None, claims, think,
+                                        random.Random(n), latencies, outcomes) for n in range(sessions)))
+    elapsed = time.perf_counter() - start
+    if server is not None:
+        server.close()
+        await server.wait_closed()
+    q = statistics.quantiles(latencies, n=100)
+    print(f"{sessions} sessions, {len(latencies)} claims in {elapsed:.2f} s ({len(latencies) / elapsed:.0f} claims/s)")
+    print(f"claim latency p50 {q[49] / 1e6:.2f} ms, p90 {q[89] / 1e6:.2f} ms, p99 {q[98] / 1e6:.2f} ms, "
+          f"max {max(latencies) / 1e6:.2f} ms")
+    print("outcomes: " + ", ".join(f"{reason} {n}" for reason, n in sorted(outcomes.items())))
+
+
+def raise_fd_limit():
+    # Every session holds a socket on each side
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve Set games over line-delimited JSON")
+    parser.add_argument("command", choices=["serve", "load"])
+    parser.add_argument("--tcp", help=f"host:port to listen on or connect to (default {DEFAULT_TCP})")
+    parser.add_argument("--unix", help="Unix socket path, used instead of TCP")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--sessions", type=int, default=2000, help="concurrent sessions of the load generator")
+    parser.add_argument("--claims", type=int, default=20, help="claims per load session")
+    parser.add_argument("--room-size", type=int, default=1, help="load sessions racing on each shared table")
+    parser.add_argument("--think", type=float, default=1.0, help="mean seconds a load session waits between claims")
+    parser.add_argument("--external", action="store_true", help="load a running server instead of an in-process one")
+    args = parser.parse_args()
+    address = {"tcp": args.tcp, "unix": args.unix}
+    raise_fd_limit()
+    if args.command == "serve":
+        async def serve():
+            server = await start_server(GameServer(args.seed), **address)
+            async with server:
+                await server.serve_forever()
+
+        asyncio.run(serve())
+    else:
+        asyncio.run(run_load(args.sessions, args.claims, args.room_size, args.think, address, args.external))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import argparse
+import json
+import os
+import random
+from collections import Counter
+from multiprocessing import Pool
+
+from SetGameController import GameController, GameLim, GameMode
+from SetGameField import GameField
+
+INFINITE_GAME_SETS = 100
+
+
+def first_set_bot(field: GameField, _rng):
+    return field.find_set()
+
+
+def random_set_bot(field: GameField, rng):
+    sets = field.all_sets()
+    return rng.choice(sets) if sets else None
+
+
+def last_set_bot(field: GameField, _rng):
+    return max(field.all_sets(), default=None)
+
+
+BOTS = {"first": first_set_bot, "random": random_set_bot, "last": last_set_bot}
+
+
+def game_modes():
+    for lim in GameLim:
+        for shuffle in (False, True):
+            # Same restriction as Settings.correct
+            if not (lim == GameLim.FIND_ALL and shuffle):
+                yield lim, shuffle
+
+
+def mode_name(lim, shuffle):
+    return f"{lim.name}{'+shuffle' if shuffle else ''}"
+
+
+class SimulationStats:
+    def __init__(self):
+        self.games = 0
+        self.table_sizes = Counter()
+        self.max_table_sizes = Counter()
+        self.sets_per_game = Counter()
+        self.flips_per_game = Counter()
+        self.leftover_cards = Counter()
+        self.deck_exhausted = 0
+        self.stuck = 0
+
+    def merge(self, other):
+        self.games += other.games
+        self.table_sizes += other.table_sizes
+        self.max_table_sizes += other.max_table_sizes
+        self.sets_per_game += other.sets_per_game
+        self.flips_per_game += other.flips_per_game
+        self.leftover_cards += other.leftover_cards
+        self.deck_exhausted += other.deck_exhausted
+        self.stuck += other.stuck
+        return self
+
+    def dump(self):
+        def hist(counter):
+            return {str(k): counter[k] for k in sorted(counter)}
+
+        return {
+            "games": self.games,
+            "table_sizes": hist(self.table_sizes),
+            "max_table_sizes": hist(self.max_table_sizes),
+            "sets_per_game": hist(self.sets_per_game),
+            "flips_per_game": hist(self.flips_per_game),
+            "leftover_cards": hist(self.leftover_cards),
+            "deck_exhausted_with_leftover": self.deck_exhausted,
+            "stuck": self.stuck
+        }
+
+
+def play_game(stats: SimulationStats, lim, shuffle, bot, seed, max_sets=INFINITE_GAME_SETS):
+    rng = random.Random(seed)
+    field = GameField(rng)
+    controller = GameController(field, GameMode(lim, shuffle), collect_stats=False)
+    controller.restart()
+    flips = 0
+    max_size = len(field)
+    stats.table_sizes[len(field)] += 1
+    while controller.is_game_played() and controller.counter < max_sets:
+        s = bot(field, rng)
+        if s is None:
+            if field.found_size() == 0:
+                stats.stuck += 1
+                break
+            field.flip_found()
+            flips += 1
+        else:
+            controller.take_set(*s)
+        stats.table_sizes[len(field)] += 1
+        max_size = max(max_size, len(field))
+    stats.games += 1
+    stats.max_table_sizes[max_size] += 1
+    stats.sets_per_game[controller.counter] += 1
+    stats.flips_per_game[flips] += 1
+    if field.deck_size() == 0:
+        stats.leftover_cards[len(field)] += 1
+        if len(field) != 0:
+            stats.deck_exhausted += 1
+
+
+def run_chunk(args):
+    lim, shuffle, bot_name, first_seed, count, max_sets = args
+    stats = SimulationStats()
+    bot = BOTS[bot_name]
+    for seed in range(first_seed, first_seed + count):
+        play_game(stats, GameLim(lim), shuffle, bot, seed, max_sets)
+    return lim, shuffle, stats
+
+
+def simulate(games, bot="random", seed=0, workers=None, chunk=1000, max_sets=INFINITE_GAME_SETS):
+    tasks = [(lim.value, shuffle, bot, seed + start, min(chunk, games - start), max_sets)
+             for lim, shuffle in game_modes() for start in range(0, games, chunk)]
+    results = {mode_name(lim, shuffle): SimulationStats() for lim, shuffle in game_modes()}
+    with Pool(workers) as pool:
+        for lim, shuffle, stats in pool.imap_unordered(run_chunk, tasks):
+            results[mode_name(GameLim(lim), shuffle)].merge(stats)
+    return {name: stats.dump() for name, stats in results.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play Set games headlessly and collect dealing statistics")
+    parser.add_argument("--games", type=int, default=10000, help="games per mode")
+    parser.add_argument("--bot", choices=BOTS.keys(), default="random")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk", type=int, default=1000)
+    parser.add_argument("--max-sets", type=int, default=INFINITE_GAME_SETS, help="sets after which a game is stopped")
+    parser.add_argument("--output", default="-")
+    args = parser.parse_args()
+    results = simulate(args.games, args.bot, args.seed, args.workers, args.chunk, args.max_sets)
+    if args.output == "-":
+        print(json.dumps(results, indent=2))
+    else:
+        json.dump(results, open(args.output, "w"), indent=2)
+
+
+if __name__ == "__main__":
+    main()
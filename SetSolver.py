@@ -0,0 +1,133 @@
+import argparse
+import random
+import time
+from collections import OrderedDict, namedtuple
+
+from SetEngine import THIRD
+from SetGameField import GameField
+
+SolveResult = namedtuple("SolveResult", ["sets", "move", "exact", "nodes"])
+DEFAULT_BUDGET = 0.2
+DEFAULT_ENTRIES = 1 << 18
+
+
+class _OutOfTime(Exception):
+    pass
+
+
+def table_sets(table):
+    return [(a, b, THIRD[a][b]) for a in table for b in table if a < b < THIRD[a][b] and THIRD[a][b] in table]
+
+
+def has_set(table):
+    return any(THIRD[a][b] in table for a in table for b in table if a < b)
+
+
+def step(table, deck, move):
+    # Same dealing rules as GameField.take_set, on a set of table codes and the remaining deck
+    rest = table.difference(move)
+    if len(table) >= 15 and has_set(rest) or not deck:
+        return rest, deck
+    rest = rest.union(deck[:3])
+    deck = deck[3:]
+    while deck and not has_set(rest):
+        rest = rest.union(deck[:3])
+        deck = deck[3:]
+    return rest, deck
+
+
+class EndgameSolver:
+    # Finds the largest number of sets still obtainable in FIND_ALL mode, where the game ends as soon as
+    # there is no set on the table. Positions are keyed by the cards on the table and the remaining deck.
+    def __init__(self, max_entries=DEFAULT_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.nodes = 0
+        self.deadline = None
+
+    def _store(self, key, value):
+        self.entries[key] = value
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _ordered_moves(self, table, deck):
+        # Moves that leave more sets on the table are tried first, they lead to long games sooner
+        children = [(move, *step(table, deck, move)) for move in table_sets(table)]
+        children.sort(key=lambda c: -len(table_sets(c[1])))
+        return children
+
+    def value(self, table, deck):
+        key = (table, deck)
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+            return value
+        self.nodes += 1
+        if self.nodes & 31 == 0 and time.perf_counter() > self.deadline:
+            raise _OutOfTime()
+        bound = (len(table) + len(deck)) // 3
+        best = 0
+        for move, next_table, next_deck in self._ordered_moves(table, deck):
+            best = max(best, 1 + self.value(next_table, next_deck))
+            if best == bound:
+                break
+        self._store(key, best)
+        return best
+
+    def solve_codes(self, table, deck, budget=DEFAULT_BUDGET):
+        table = frozenset(table)
+        deck = bytes(deck)
+        self.nodes = 0
+        self.deadline = time.perf_counter() + budget
+        bound = (len(table) + len(deck)) // 3
+        best, best_move, exact = 0, None, True
+        try:
+            for move, next_table, next_deck in self._ordered_moves(table, deck):
+                value = 1 + self.value(next_table, next_deck)
+                if value > best:
+                    best, best_move = value, move
+                if best == bound:
+                    break
+        except _OutOfTime:
+            exact = False
+            if best_move is None:
+                # Not even one line was searched to the end; fall back to the move ordering's favourite
+                best_move = next(iter(self._ordered_moves(table, deck)), (None,))[0]
+        return SolveResult(best, best_move, exact, self.nodes)
+
+    def solve(self, field: GameField, budget=DEFAULT_BUDGET):
+        result = self.solve_codes([card.code for card in field.on_table], [card.code for card in field.deck], budget)
+        if result.move is None:
+            return result
+        slots = {card.code: idx for idx, card in enumerate(field.on_table)}
+        move = sorted((slots[code] for code in result.move), reverse=True)
+        return result._replace(move=move)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve FIND_ALL games from random positions")
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--deck", type=int, default=15, help="cards left in the deck when solving starts")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET, help="seconds per position")
+    parser.add_argument("--entries", type=int, default=DEFAULT_ENTRIES, help="transposition table size")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    solver = EndgameSolver(args.entries)
+    for game in range(args.games):
+        field = GameField(rng)
+        while field.deck_size() > args.deck and field.has_set():
+            field.take_set(*rng.choice(field.all_sets()))
+        greedy = field.fork(random.Random(0))
+        while greedy.has_set():
+            greedy.take_set(*greedy.find_set())
+        start = time.perf_counter()
+        result = solver.solve(field, args.budget)
+        elapsed = time.perf_counter() - start
+        print(f"game {game}: {len(field)} on table, {field.deck_size()} in deck: best {result.sets} sets "
+              f"({'exact' if result.exact else 'lower bound'}), first-set play {greedy.found_size() // 3 - field.found_size() // 3}, "
+              f"{result.nodes} nodes in {1000 * elapsed:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
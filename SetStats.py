@@ -0,0 +1,234 @@
+import atexit
+import csv
+import math
+import os
+import struct
+import time
+from array import array
+from collections import deque, namedtuple
+from pathlib import Path
+from queue import Empty, Full, Queue
+from threading import Thread
+
+from SetCard import CardColor, CardFill, CardShape
+from SetEngine import ATTR_COUNT, digits
+from SetMetrics import METRICS
+
+CARD_ATTRS = ["Shape", "Fill", "Color", "Count"]
+TRAIT_OPTIONS = [[str(opt) for opt in CardShape], [str(opt) for opt in CardFill], [str(opt) for opt in CardColor],
+                 ["Count." + str(opt) for opt in range(1, 4)]]
+CONTEXT_COLUMNS = [col for attr, options in zip(CARD_ATTRS, TRAIT_OPTIONS) for col in [*options, "Set." + attr]] + \
+                  ["Time", "IsRand", "IsHint"]
+TIMING_COLUMNS = ["Clicks", "Deselects", "WrongAttempts", "FirstClick", "ClickInterval", "MaxClickInterval",
+                  "HintTime"]
+STATS_COLUMNS = CONTEXT_COLUMNS + TIMING_COLUMNS
+STATS_TYPES = "h" * (len(CONTEXT_COLUMNS) - 3) + "dbb" + "hhh" + "dddd"
+
+SetSnapshot = namedtuple("SetSnapshot", ["codes", "indices", "time", "is_rand", "is_hint", "timing"])
+# Fixed-width snapshot records, read back by SetFeatures as NumPy record arrays
+SNAPSHOT_SUFFIX = ".snapshots"
+SNAPSHOT_TABLE = 21
+NO_CARD = 255
+SNAPSHOT_RECORD = struct.Struct(f"<{SNAPSHOT_TABLE}s3sdBB")
+
+
+def get_set_context(codes, i, j, k):
+    traits = [digits(code) for code in codes]
+    row = []
+    for attr in range(ATTR_COUNT):
+        counts = [0, 0, 0]
+        for tr in traits:
+            counts[tr[attr]] += 1
+        val = traits[i][attr]
+        if attr == ATTR_COUNT - 1:
+            val += 1
+        row += counts
+        row.append(val if traits[i][attr] == traits[j][attr] == traits[k][attr] else -1)
+    return row
+
+
+def snapshot_path(stats_path):
+    return Path(stats_path).with_suffix(SNAPSHOT_SUFFIX)
+
+
+def pack_snapshot(s: SetSnapshot):
+    return SNAPSHOT_RECORD.pack(bytes(s.codes).ljust(SNAPSHOT_TABLE, bytes((NO_CARD,))), bytes(s.indices), s.time,
+                                s.is_rand, s.is_hint)
+
+
+def search_timing(start, clicks, deselects, wrong_attempts, hint=None):
+    # Times are monotonic nanoseconds; the summary is in seconds, NaN when there were too few clicks or no hint
+    gaps = [b - a for a, b in zip(clicks, clicks[1:])]
+    return (len(clicks), deselects, wrong_attempts,
+            (clicks[0] - start) / 1e9 if clicks else math.nan,
+            sum(gaps) / len(gaps) / 1e9 if gaps else math.nan,
+            max(gaps) / 1e9 if gaps else math.nan,
+            (hint - start) / 1e9 if hint is not None else math.nan)
+
+
+class StatsRecorder:
+    def __init__(self, path, chunk_size=16, flush_interval=10):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        self.columns = [array(t, [0]) * chunk_size for t in STATS_TYPES]
+        self.size = 0
+        self.last_flush = time.monotonic()
+        self.exit_hook = False
+        self.file_columns = None
+
+    def append(self, row):
+        if not self.exit_hook:
+            atexit.register(self.flush)
+            self.exit_hook = True
+        for col, val in zip(self.columns, row):
+            col[self.size] = val
+        self.size += 1
+        if self.size == self.chunk_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if self.size == 0:
+            return
+        path = Path(self.path)
+        header = not path.exists() or path.stat().st_size == 0
+        if header:
+            self.file_columns = list(range(len(STATS_COLUMNS)))
+        elif self.file_columns is None:
+            self.file_columns = self._read_file_columns(path)
+        cols = [self.columns[n][:self.size] if n is not None else [""] * self.size for n in self.file_columns]
+        with open(path, "a", newline="") as f:
+            writer = csv.writer(f)
+            if header:
+                writer.writerow(STATS_COLUMNS)
+            writer.writerows(zip(*cols))
+            f.flush()
+            os.fsync(f.fileno())
+        self.size = 0
+
+    @staticmethod
+    def _read_file_columns(path):
+        # Files started by older versions keep their header, so rows are cut down to its columns
+        with open(path, newline="") as f:
+            header = next(csv.reader(f), [])
+        return [STATS_COLUMNS.index(col) if col in STATS_COLUMNS else None for col in header]
+
+    def set_path(self, path):
+        if path != self.path:
+            self.flush()
+            self.path = path
+            self.file_columns = None
+
+    def close(self):
+        self.flush()
+        if self.exit_hook:
+            atexit.unregister(self.flush)
+            self.exit_hook = False
+
+
+class StatsWorker:
+    def __init__(self, recorder: StatsRecorder, max_queue=1024):
+        self.recorder = recorder
+        self.queue = Queue(max_queue)
+        # Takes items in order while the queue is full, so that control messages never block the caller
+        self.overflow = deque()
+        self.dropped = 0
+        self.thread = None
+
+    def _start(self):
+        if self.thread is None:
+            # The worker drains and flushes the recorder itself on exit
+            self.recorder.exit_hook = True
+            self.thread = Thread(target=self._run, name="stats-worker", daemon=True)
+            self.thread.start()
+            atexit.register(self.close)
+
+    def submit(self, snapshot: SetSnapshot):
+        self._start()
+        if self.overflow:
+            if len(self.overflow) < self.queue.maxsize:
+                self.overflow.append(snapshot)
+            else:
+                self.dropped += 1
+            return
+        try:
+            self.queue.put_nowait(snapshot)
+        except Full:
+            self.dropped += 1
+
+    def _control(self, item):
+        if not self.overflow:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except Full:
+                pass
+        self.overflow.append(item)
+
+    def set_path(self, path):
+        if self.thread is None:
+            self.recorder.set_path(path)
+        else:
+            self._control(("path", path))
+
+    def flush(self):
+        if self.thread is not None:
+            self._control(("flush", None))
+
+    def close(self):
+        if self.thread is not None:
+            if self.thread.is_alive():
+                self._control(("close", None))
+                self.thread.join()
+            # Closed workers don't stay reachable from the exit hooks
+            atexit.unregister(self.close)
+
+    def _process(self, batch):
+        # Pure Python, so the game never depends on NumPy; SetFeatures reads the snapshots offline
+        start = time.perf_counter_ns()
+        with open(snapshot_path(self.recorder.path), "ab") as f:
+            f.write(b"".join(pack_snapshot(s) for s in batch))
+        for s in batch:
+            self.recorder.append(get_set_context(s.codes, *s.indices) + [s.time, s.is_rand, s.is_hint, *s.timing])
+        METRICS.record("stats.record", (time.perf_counter_ns() - start) // len(batch))
+
+    def _next(self, block):
+        # Overflow items were all added after the queued ones, so they come next once the queue is empty
+        try:
+            return self.queue.get_nowait()
+        except Empty:
+            if self.overflow:
+                return self.overflow.popleft()
+            if not block:
+                raise
+        return self.queue.get(timeout=self.recorder.flush_interval)
+
+    def _run(self):
+        batch = []
+        while True:
+            try:
+                item = self._next(not batch)
+            except Empty:
+                if batch:
+                    self._process(batch)
+                    batch = []
+                else:
+                    self.recorder.flush()
+                continue
+            if isinstance(item, SetSnapshot):
+                batch.append(item)
+                if len(batch) >= self.recorder.chunk_size:
+                    self._process(batch)
+                    batch = []
+                continue
+            if batch:
+                self._process(batch)
+                batch = []
+            if item[0] == "path":
+                self.recorder.set_path(item[1])
+            elif item[0] == "flush":
+                self.recorder.flush()
+            else:
+                self.recorder.flush()
+                return
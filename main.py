@@ -1,11 +1,30 @@
+import os
+import sys
+import time
+
+startup_times = {"start": time.perf_counter()}
+
 import gi
 
 gi.require_version('Gtk', '3.0')
-from gi.repository import Gtk, Gdk, GLib
-from SetGameController import write_stats
-from SetGame import Game, GameLim, Settings
+from gi.repository import Gtk, Gdk
+from SetGame import MAX_TARGET_SETS, Difficulty, Game, GameLim, Settings
+from SetMetrics import METRICS
+from SetScheduler import FrameScheduler
 
 SETTINGS_PATH = "settings.json"
+STARTUP_REPORT = os.environ.get("SETGAME_STARTUP_REPORT")
+# The status shows whole seconds, so it only needs a wakeup when the next second starts
+STATUS_PERIOD_NS = 10 ** 9
+METRICS_DUMP_PERIOD_NS = 10 * 10 ** 9
+
+startup_times["imports"] = time.perf_counter()
+
+
+def report_startup():
+    t0 = startup_times["start"]
+    line = ", ".join(f"{stage} {1000 * (t - t0):.1f} ms" for stage, t in startup_times.items() if stage != "start")
+    print(f"Startup: {line}", file=sys.stderr)
 
 
 def settings_window(initial_params: Settings, confirm_callback):
@@ -30,10 +49,14 @@ def settings_window(initial_params: Settings, confirm_callback):
         settings_altered()
         initial_params.mode.limit = GameLim(game_lim_cb.get_active())
         initial_params.mode.shuffle = always_shuffle.get_property("active")
+        initial_params.mode.difficulty = Difficulty(difficulty_cb.get_active())
+        initial_params.mode.sets_target = sets_target_sb.get_value_as_int() or None
         initial_params.disable_hint = hide_hint_chb.get_property("active")
         initial_params.field_layout.field_vertical = field_orient_cb.get_active() == 1
         initial_params.field_layout.card_vertical = card_orient_cb.get_active() == 1
+        initial_params.renderer = renderer_cb.get_active_id()
         always_shuffle.set_sensitive(initial_params.mode.limit != GameLim.FIND_ALL)
+        difficulty_cb.set_sensitive(initial_params.mode.sets_target is None)
         return
 
     def switch_handler(widget, event):
@@ -58,6 +81,23 @@ def settings_window(initial_params: Settings, confirm_callback):
     always_shuffle.connect("toggled", cbox_handler)
     gr.attach(always_shuffle, 0, row_n, 2, 1)
 
+    row_n += 1
+    difficulty_cb = Gtk.ComboBoxText()
+    for var in Difficulty:
+        difficulty_cb.append_text(str(var))
+    difficulty_cb.set_active(initial_params.mode.difficulty.value)
+    difficulty_cb.set_sensitive(initial_params.mode.sets_target is None)
+    difficulty_cb.connect("changed", cbox_handler)
+    gr.attach(Gtk.Label(label="Difficulty"), 0, row_n, 1, 1)
+    gr.attach(difficulty_cb, 1, row_n, 1, 1)
+
+    row_n += 1
+    sets_target_sb = Gtk.SpinButton.new_with_range(0, MAX_TARGET_SETS, 1)
+    sets_target_sb.set_value(initial_params.mode.sets_target or 0)
+    sets_target_sb.connect("value-changed", cbox_handler)
+    gr.attach(Gtk.Label(label="Sets on a new table (0 for any)"), 0, row_n, 1, 1)
+    gr.attach(sets_target_sb, 1, row_n, 1, 1)
+
     row_n += 1
     hide_hint_chb = Gtk.CheckButton(label="Disable hint button")
     hide_hint_chb.set_active(initial_params.disable_hint)
@@ -82,6 +122,15 @@ def settings_window(initial_params: Settings, confirm_callback):
     gr.attach(Gtk.Label(label="Card orientation"), 0, row_n, 1, 1)
     gr.attach(card_orient_cb, 1, row_n, 1, 1)
 
+    row_n += 1
+    renderer_cb = Gtk.ComboBoxText()
+    renderer_cb.append("grid", "Widget per card")
+    renderer_cb.append("canvas", "Single canvas")
+    renderer_cb.set_active_id(initial_params.renderer)
+    renderer_cb.connect("changed", cbox_handler)
+    gr.attach(Gtk.Label(label="Field renderer"), 0, row_n, 1, 1)
+    gr.attach(renderer_cb, 1, row_n, 1, 1)
+
     row_n += 1
     stats_collect = Gtk.Switch()
     stats_collect.set_state(initial_params.stats_collect)
@@ -164,8 +213,13 @@ def main_window():
     win.add(main_l)
     win.set_icon_from_file("setgame.ico")
 
+    status_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=15, halign=Gtk.Align.CENTER)
+    main_l.pack_start(status_box, False, False, 5)
     lab = Gtk.Label(label="Click New game to start")
-    main_l.pack_start(lab, False, False, 5)
+    status_box.pack_start(lab, False, False, 0)
+    metrics_lab = Gtk.Label()
+    metrics_lab.set_no_show_all(True)
+    status_box.pack_start(metrics_lab, False, False, 0)
 
     field_grid = Gtk.Grid(row_spacing=15, column_spacing=15)
     field_grid.set_column_homogeneous(True)
@@ -186,20 +240,36 @@ def main_window():
         d.destroy()
 
     settings = Settings(SETTINGS_PATH)
-    game = Game(asp, settings, on_game_over)
+    scheduler = FrameScheduler(win)
+    game = Game(asp, settings, on_game_over, scheduler)
+
+    def show_metrics(enabled):
+        METRICS.enabled = enabled
+        metrics_lab.set_visible(enabled)
+        if enabled:
+            metrics_lab.set_label(METRICS.overlay_text())
+
+    show_metrics(settings.metrics)
 
     KEYS = ['QWERTYU', 'ASDFGHJ', 'ZXCVBNM']
 
     def on_key_press_event(_widget, event):
+        if event.keyval == Gdk.KEY_F12:
+            settings.metrics = not settings.metrics
+            settings.to_file(SETTINGS_PATH)
+            show_metrics(settings.metrics)
+            scheduler.wake()
+            return
         key = Gdk.keyval_name(event.hardware_keycode)
-        i = 0
-        for row in KEYS:
+        for i, row in enumerate(KEYS):
             if key in row:
+                # Key rows run along the long side of the field
                 j = row.find(key)
-                if not game.view.layout.field_vertical:
-                    game.view.process_card_clicked(i + j * 3)
+                if game.view.layout.field_vertical:
+                    game.view.select_cell(i, j)
+                else:
+                    game.view.select_cell(j, i)
                 return
-            i += 1
 
     win.connect("key_press_event", on_key_press_event)
 
@@ -215,6 +285,9 @@ def main_window():
 
     def on_restart(_widget):
         game.restart()
+        # The game clock starts over, so the next status tick moves to its new second boundaries
+        scheduler.cancel_timer()
+        scheduler.wake()
 
     restart_button = Gtk.Button(label="New game")
     restart_button.connect("clicked", on_restart)
@@ -225,11 +298,19 @@ def main_window():
         new_settings.to_file(SETTINGS_PATH)
         game.update_settings(new_settings)
         hint_button.set_sensitive(not new_settings.disable_hint)
+        show_metrics(new_settings.metrics)
+        scheduler.wake()
+
+    settings_win = None
+
+    def on_settings_request(_widget):
+        nonlocal settings_win
+        if settings_win is None:
+            settings_win = settings_window(settings, on_settings_changed)
+        settings_win.show_all()
 
     settings_button = Gtk.Button(label="Settings")
-    settings_win = settings_window(settings, on_settings_changed)
-    settings_win.hide()
-    settings_button.connect("clicked", lambda _widget: settings_win.show_all())
+    settings_button.connect("clicked", on_settings_request)
     bts.pack_start(settings_button, False, False, 0)
 
     def on_help_request(_widget):
@@ -239,7 +320,7 @@ def main_window():
             "Each Set contains three cards, which should be all the same or all different by each parameter: "
             "color, shape, fill and number of objects. "
             "\nTo select a card, click it. "
-            "You can also use keyboard shortcuts if the game field is aligned horizontally: "
+            "You can also use keyboard shortcuts: the key rows QWERTYU, ASDFGHJ and ZXCVBNM follow the long side of the field. "
             "For example, pressing Q is equal to clicking the card in the top-left position. ",
             message_type=Gtk.MessageType.INFO,
             buttons=Gtk.ButtonsType.OK,
@@ -256,26 +337,64 @@ def main_window():
     main_l.pack_start(asp, True, True, 5)
 
     def on_destroy(_w, _e):
-        nonlocal settings
-        if settings.stats_collect:
-            write_stats(settings.stats_path)
+        game.close()
+        if METRICS.enabled:
+            METRICS.dump(settings.metrics_path)
         return False
 
     win.connect("destroy", Gtk.main_quit)
     win.connect("delete-event", on_destroy)
 
+    last_dump = time.monotonic_ns()
+
+    def on_status_tick():
+        nonlocal last_dump
+        if METRICS.enabled:
+            metrics_lab.set_label(METRICS.overlay_text())
+            if time.monotonic_ns() - last_dump >= METRICS_DUMP_PERIOD_NS:
+                METRICS.dump(settings.metrics_path)
+                last_dump = time.monotonic_ns()
+
     def update_status():
+        # Runs with every frame the scheduler wakes up for, so clicks, taken sets and ticks share one pass
         if game.controller.is_game_played():
-            lab.set_label(game.controller.status())
+            status = game.controller.status()
         else:
-            lab.set_label("Click New game to start")
-        return True
+            status = "Click New game to start"
+        if lab.get_label() != status:
+            lab.set_label(status)
+        if game.controller.is_game_played() and win.is_active():
+            if not scheduler.timer_pending():
+                elapsed = time.monotonic_ns() - game.controller.game_start_timestamp
+                scheduler.request_after(STATUS_PERIOD_NS - elapsed % STATUS_PERIOD_NS, "tick", on_status_tick)
+        elif METRICS.enabled:
+            if not scheduler.timer_pending():
+                scheduler.request_after(STATUS_PERIOD_NS, "tick", on_status_tick)
+        else:
+            scheduler.cancel_timer()
+
+    scheduler.add_frame_hook(update_status)
+    scheduler.wake()
+
+    def on_active_changed(_win, _param):
+        # Losing focus stops the timer at the next frame, getting it back shows the current time
+        scheduler.wake()
+
+    win.connect("notify::is-active", on_active_changed)
+
+    def on_first_frame(_w, _ctx):
+        win.disconnect(first_frame_handler)
+        startup_times["first frame"] = time.perf_counter()
+        if STARTUP_REPORT:
+            report_startup()
+        return False
 
-    GLib.timeout_add(100, update_status)
+    first_frame_handler = win.connect_after("draw", on_first_frame)
 
     return win
 
 
 w = main_window()
+startup_times["window"] = time.perf_counter()
 w.show_all()
 Gtk.main()
@@ -0,0 +1,19 @@
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from SetBatchField import differential_check
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_batch_field_matches_game_field(seed):
+    differential_check(games=20, steps=40, seed=seed)
+
+
+def test_batch_field_imports_without_cairo():
+    # Blocking the module makes any import of it fail, as on a machine without pycairo
+    code = "import sys; sys.modules['cairo'] = None; import SetBatchField"
+    subprocess.run([sys.executable, "-c", code], check=True)
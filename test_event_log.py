@@ -0,0 +1,39 @@
+import random
+
+from SetEventLog import HEADER, RECORD, Event, EventLog
+from SetGameController import GameController, GameLim, GameMode
+from SetGameField import GameField
+
+
+def replay_table(path):
+    # Slot -> card code after every SET_TAKEN and its follow-up events, from the records alone
+    data = path.read_bytes()[HEADER.size:]
+    table = {}
+    for t, event, slot, *cards in RECORD.iter_unpack(data):
+        if event == Event.SHUFFLE:
+            table.clear()
+        elif event == Event.SET_TAKEN:
+            table = {s: code for s, code in table.items() if code not in cards}
+        elif event in (Event.DEAL, Event.MOVE):
+            table = {s: code for s, code in table.items() if code != cards[0]}
+            table[slot] = cards[0]
+    return table
+
+
+def test_log_replays_table_layout(tmp_path):
+    rng = random.Random(0)
+    path = tmp_path / "game.setlog"
+    events = EventLog(path)
+    controller = GameController(GameField(rng), GameMode(GameLim.FIND_ALL, False), collect_stats=False,
+                                stats_path=tmp_path / "stats.csv", events=events)
+    controller.restart()
+    moved = False
+    while controller.is_game_played():
+        size = len(controller.field)
+        controller.take_set(*rng.choice(controller.field.all_sets()))
+        moved |= len(controller.field) < size
+        events.flush()
+        assert replay_table(path) == {slot: card.code for slot, card in enumerate(controller.field.on_table)}
+    assert moved
+    controller.stats.close()
+    events.close()
@@ -0,0 +1,22 @@
+import random
+
+import SetGameField
+from SetGameField import GameField
+
+
+def test_constrained_deal_stays_in_band():
+    field = GameField(random.Random(0))
+    for lo, hi in [(1, 1), (2, 3), (4, 22), (6, 6)]:
+        field.shuffle((lo, hi))
+        assert not field.off_band
+        assert len(field) == 12 and lo <= field.count_sets() <= hi
+
+
+def test_unreachable_band_deals_closest_table(monkeypatch):
+    monkeypatch.setattr(SetGameField, "MAX_DEAL_ATTEMPTS", 200)
+    field = GameField(random.Random(0))
+    field.shuffle((40, 40))
+    assert field.off_band
+    assert field.count_sets() >= 5
+    field.shuffle((1, 1))
+    assert not field.off_band
@@ -0,0 +1,31 @@
+import gc
+import weakref
+
+from SetStats import SetSnapshot, StatsRecorder, StatsWorker, search_timing
+
+
+def make_snapshot():
+    return SetSnapshot(tuple(range(12)), (0, 1, 2), 1.0, True, False, search_timing(0, [], 0, 0, None))
+
+
+def test_closed_workers_are_released(tmp_path):
+    refs = []
+    for n in range(3):
+        worker = StatsWorker(StatsRecorder(tmp_path / f"stats{n}.csv"))
+        worker.submit(make_snapshot())
+        worker.close()
+        refs.append(weakref.ref(worker))
+    del worker
+    gc.collect()
+    assert all(ref() is None for ref in refs)
+    assert all((tmp_path / f"stats{n}.csv").exists() for n in range(3))
+
+
+def test_closed_recorders_are_released(tmp_path):
+    recorder = StatsRecorder(tmp_path / "stats.csv")
+    recorder.append([0] * len(recorder.columns))
+    recorder.close()
+    ref = weakref.ref(recorder)
+    del recorder
+    gc.collect()
+    assert ref() is None